@@ -0,0 +1,73 @@
+class AdaptiveLimit:
+    """
+    Number of concurrent page downloads of a process, adapted with AIMD
+    (additive increase, multiplicative decrease) to how twitter.com responds.
+
+    Every healthy response adds increase/value, so the limit grows by about
+    `increase` per round of `value` responses. A failed request, an error
+    status or a recent latency above latency_factor times the long-run
+    latency multiplies the limit by decrease, at most once per round, so a
+    burst of errors counts as a single signal. 404s are healthy: they are
+    deleted or protected tweets, not twitter pushing back.
+
+    The limit never goes below 1, so downloads can't stop altogether.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, increase=1.0,
+        decrease=0.5, latency_factor=2.0, warmup=20):
+        self.minimum = max(minimum, 1)
+        self.maximum = maximum or initial
+        self.value = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.warmup = warmup # responses before latency is judged
+
+        self.baseline = None # slow moving average of the latency
+        self.recent = None # fast moving average of the latency
+        self.n_responses = 0
+        self.since_decrease = self.value # responses since the last decrease
+        self.n_increases = self.n_decreases = 0
+
+    def __int__(self):
+        return int(self.value)
+
+    def record(self, status_code, seconds):
+        """
+        Adapts the limit to a response; status_code is None if the request
+        failed. Returns 'increase', 'decrease' or None.
+        """
+        self.n_responses += 1
+        self.since_decrease += 1
+
+        if status_code is None or status_code not in (200, 404):
+            return self._decrease()
+
+        self.recent = seconds if self.recent is None else \
+            0.8 * self.recent + 0.2 * seconds
+        self.baseline = seconds if self.baseline is None else \
+            0.99 * self.baseline + 0.01 * seconds
+        if self.n_responses > self.warmup and \
+            self.recent > self.latency_factor * self.baseline:
+            return self._decrease()
+
+        before = int(self.value)
+        self.value = min(self.value + self.increase / self.value, self.maximum)
+        if int(self.value) > before:
+            self.n_increases += 1
+            return 'increase'
+        return None
+
+    def _decrease(self):
+        if self.since_decrease < self.value:
+            return None # already backed off for this round
+        self.since_decrease = 0
+        if self.value <= self.minimum:
+            return None
+        self.value = max(self.value * self.decrease, self.minimum)
+        self.recent = self.baseline # judge the new level afresh
+        self.n_decreases += 1
+        return 'decrease'
+
+    def at_minimum(self):
+        return self.value <= self.minimum
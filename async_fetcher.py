@@ -0,0 +1,57 @@
+import asyncio
+import logging
+
+import aiohttp
+
+
+class AsyncFetcher:
+    """
+    Downloads pages concurrently from a single event loop. At most
+    max_concurrency requests are in flight at a time, and each request
+    is abandoned after timeout seconds.
+    """
+
+    def __init__(self, max_concurrency=200, timeout=10):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.session = None # created inside the loop on first use
+
+    def fetch_all(self, urls, concurrency=None):
+        """
+        Downloads all urls and returns a list of (url, status_code, html,
+        seconds), in the same order as urls. status_code and html are None
+        for the requests that got no response. concurrency, if given,
+        lowers the number of requests in flight for this call.
+        """
+        return self.loop.run_until_complete(self._fetch_all(urls,
+            min(concurrency or self.max_concurrency, self.max_concurrency)))
+
+    async def _fetch_all(self, urls, concurrency):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency))
+
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(
+            *[self._fetch(semaphore, url) for url in urls])
+
+    async def _fetch(self, semaphore, url):
+        async with semaphore:
+            start = self.loop.time()
+            try:
+                async with self.session.get(url) as response:
+                    html = await response.text()
+                    return url, response.status, html, self.loop.time() - start
+            except asyncio.TimeoutError:
+                logging.error("{} timed out after {}s".format(url, self.timeout))
+            except aiohttp.ClientError as e:
+                # twitter probably rejected the request
+                logging.error("{}: {}".format(url, e))
+            return url, None, None, self.loop.time() - start
+
+    def close(self):
+        if self.session is not None:
+            self.loop.run_until_complete(self.session.close())
+        self.loop.close()
@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+
+from collections import OrderedDict
+from time import time
+
+
+class AuthorCache:
+    """
+    Remembers when each author was last scanned, so authors that keep
+    appearing in the stream are not rescanned within ttl seconds. Holds at
+    most capacity authors; the least recently scanned are evicted first.
+    """
+
+    def __init__(self, ttl=21600, capacity=100000):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.scanned = OrderedDict() # author -> time of the last scan, oldest first
+        self.hits = 0
+        self.misses = 0
+
+    def seen_recently(self, author):
+        """
+        Returns True if the author was scanned less than ttl seconds ago.
+        """
+        scanned_at = self.scanned.get(author)
+        if scanned_at is not None and time() - scanned_at < self.ttl:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, author):
+        """
+        Records the author as scanned now.
+        """
+        now = time()
+        self.scanned[author] = now
+        self.scanned.move_to_end(author)
+        self._evict(now)
+
+    def _evict(self, now):
+        while self.scanned:
+            author, scanned_at = next(iter(self.scanned.items()))
+            if len(self.scanned) <= self.capacity and now - scanned_at < self.ttl:
+                break
+            del self.scanned[author]
+
+    def __len__(self):
+        return len(self.scanned)
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self.scanned.items()), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path, ttl=21600, capacity=100000):
+        """
+        Restores the cache saved at path if there is one, or creates a new one.
+        Entries that expired in the meantime are dropped.
+        """
+        cache = cls(ttl, capacity)
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                cache.scanned = OrderedDict(json.load(f))
+            cache._evict(time())
+            logging.info("Restored {} recently scanned authors from {}"
+                .format(len(cache), path))
+        return cache
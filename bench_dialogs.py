@@ -0,0 +1,90 @@
+"""Compares dialog reconstruction with ReplyIndex against the previous
+backtracking loop, which inserted each source tweet at the head of the dialog.
+
+Usage: python bench_dialogs.py [--threads N] [--length L] [--branches B]
+
+Builds a synthetic reply forest of N threads. Each thread is a chain of
+L tweets plus B extra terminal tweets, which reply to random tweets of the chain.
+"""
+
+import argparse
+import random
+
+from time import time
+from reply_index import ReplyIndex
+
+
+def make_forest(n_threads, length, n_branches, seed=0):
+    rng = random.Random(seed)
+    tweets = []
+    terminals = []
+    next_id = 1
+    for _ in range(n_threads):
+        chain = []
+        reply_id = None
+        for _ in range(length):
+            chain.append({'id': next_id, 'in_reply_to_status_id': reply_id})
+            reply_id = next_id
+            next_id += 1
+        tweets.extend(chain)
+        terminals.append(chain[-1])
+        for _ in range(n_branches):
+            source = rng.choice(chain)
+            branch = {'id': next_id, 'in_reply_to_status_id': source['id']}
+            next_id += 1
+            tweets.append(branch)
+            terminals.append(branch)
+    # timelines list the newest tweets first
+    terminals.sort(key=lambda tweet: tweet['id'], reverse=True)
+    return tweets, terminals
+
+
+def backtrack(tweets, terminals):
+    tweet_set = dict((tweet['id'], tweet) for tweet in tweets)
+    visited = set()
+    dialogs = []
+    for tweet in terminals:
+        tid = tweet['id']
+        if tid not in visited:
+            visited.add(tid)
+            dialog = [tweet]
+            reply_id = tweet_set[tid]['in_reply_to_status_id']
+            while reply_id is not None:
+                visited.add(reply_id)
+                if reply_id in tweet_set:
+                    dialog.insert(0,tweet_set[reply_id])
+                else:
+                    break
+                reply_id = tweet_set[reply_id]['in_reply_to_status_id']
+            dialogs.append(dialog)
+    return dialogs
+
+
+def reply_index(tweets, terminals):
+    return [dialog for tid, dialog in ReplyIndex(tweets).dialogs(terminals)]
+
+
+def main(n_threads, length, n_branches):
+    tweets, terminals = make_forest(n_threads, length, n_branches)
+    print('%d tweets, %d terminals' % (len(tweets), len(terminals)))
+
+    timings = {}
+    results = {}
+    for name, method in [('backtrack', backtrack), ('reply_index', reply_index)]:
+        start = time()
+        results[name] = method(tweets, terminals)
+        timings[name] = time() - start
+        print('%-12s %8.3f s  %d dialogs' % (name, timings[name], len(results[name])))
+
+    assert results['backtrack'] == results['reply_index']
+    print('speedup: %.1fx' % (timings['backtrack'] / timings['reply_index']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=100)
+    parser.add_argument('--length', type=int, default=2000)
+    parser.add_argument('--branches', type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.threads, args.length, args.branches)
@@ -0,0 +1,60 @@
+"""Compares the conversation page parsers of scraping.Tweet.
+
+Usage: python bench_parsers.py [--rounds N] page.html [page.html ...]
+
+The pages are conversation pages saved from https://twitter.com/i/web/status/<id>,
+e.g. the ones in fixtures/pages/.
+Each parser runs in a fresh process, so its peak memory is measured in isolation.
+"""
+
+import argparse
+import multiprocessing as mp
+import resource
+
+from time import time
+from scraping import Tweet
+
+PARSERS = ['bs4', 'lxml']
+
+
+def run(parser, pages, rounds, results):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    n_tweets = 0
+    start = time()
+    for _ in range(rounds):
+        for html in pages:
+            n_tweets += len(list(Tweet.from_conversation(html, parser=parser)))
+    elapsed = time() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((parser, len(pages) * rounds / elapsed, n_tweets // rounds,
+        (peak - baseline) / 1024))
+
+
+def main(paths, rounds):
+    pages = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+
+    results = mp.Queue()
+    print('{:<6} {:>12} {:>8} {:>16}'.format(
+        'parser', 'pages/sec', 'tweets', 'peak mem (MB)'))
+    for parser in PARSERS:
+        process = mp.Process(target=run, args=(parser, pages, rounds, results))
+        process.start()
+        parser, pages_per_sec, n_tweets, peak_mb = results.get()
+        process.join()
+        print('{:<6} {:>12.1f} {:>8} {:>16.1f}'.format(
+            parser, pages_per_sec, n_tweets, peak_mb))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=10,
+        help="how many times each page is parsed")
+    parser.add_argument('pages', nargs='+', help="saved conversation pages")
+    args = parser.parse_args()
+
+    main(args.pages, args.rounds)
@@ -0,0 +1,216 @@
+"""Measures the throughput of getdialogs offline, by replaying recorded stream
+statuses into StreamListener.on_data while timelines and conversation pages
+are served from a local fixture store.
+
+Usage: python bench_replay.py [--processes 1,2,4] [--threads 2,8]
+                              [--output bench_replay.json] fixtures/
+
+The fixture directory holds:
+  statuses.jsonl              one status of the streaming API per line
+  timelines/<screen_name>.json  the response of statuses/user_timeline
+  pages/<tweet id>.html       the conversation page of a tweet
+
+The repository ships a small set in fixtures/, written by record_fixtures.py,
+which can record larger ones. Timelines and pages missing from the store are
+answered with an empty list and a 404, as twitter would for protected accounts
+and deleted tweets.
+
+Every combination of --processes and --threads is run in turn. Statuses are
+replayed as fast as the workers take batches, so no tweet is dropped, and the
+listener is drained before the clock stops. The fixture server runs in its own
+process, so its CPU isn't counted. Results are printed and saved as JSON.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from time import time, sleep
+
+import scraping
+from getdialogs import StreamListener
+
+STAGES = ['timeline', 'pages', 'page_fetch', 'parse', 'write', 'disk_write',
+          'batch']
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, like twitter.com
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/1.1/statuses/user_timeline.json':
+            screen_name = parse_qs(url.query).get('screen_name', [''])[0]
+            path = os.path.join('timelines', os.path.basename(screen_name) + '.json')
+            self.send_file(path, 'application/json', missing=b'[]')
+        elif url.path.startswith('/i/web/status/'):
+            path = os.path.join('pages', os.path.basename(url.path) + '.html')
+            self.send_file(path, 'text/html; charset=utf-8')
+        else:
+            self.send_file(None, 'text/plain')
+
+    def send_file(self, path, content_type, missing=None):
+        body = None
+        if path is not None:
+            try:
+                with open(os.path.join(self.server.root, path), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                pass
+        status = 200
+        if body is None:
+            body = missing
+        if body is None:
+            status, body = 404, b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(root, port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), FixtureHandler)
+    server.root = root
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def start_server(root, port):
+    process = mp.Process(target=serve, args=(root, port), daemon=True)
+    process.start()
+    sleep(0.5) # let it bind
+    return process
+
+
+def load_statuses(root):
+    with open(os.path.join(root, 'statuses.jsonl'), encoding='utf-8') as f:
+        return [line for line in f if line.strip()]
+
+
+def cpu_time():
+    usage = [resource.getrusage(who)
+             for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return (sum(u.ru_utime for u in usage), sum(u.ru_stime for u in usage))
+
+
+def run(statuses, processes, threads, args):
+    outfile = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+    outfile.close()
+
+    cpu_start = cpu_time()
+    start = time()
+    listener = StreamListener(outfile.name, args.config, threads, processes,
+        args.min_length, args.max_length, engine=args.engine,
+        parser=args.parser, author_ttl=0)
+    for status in statuses:
+        # a live stream would lose tweets here; wait for the workers instead
+        while listener.batch_pool.full():
+            sleep(0.001)
+        listener.on_data(status)
+    listener.queue_remaining() # the last, partial batch
+    listener.close(drain=True)
+    elapsed = time() - start
+    cpu_end = cpu_time()
+
+    # the last observations of the workers may still be in the pipe
+    while not listener.metrics.queue.empty():
+        sleep(0.01)
+    sleep(0.1)
+    snapshot = listener.metrics.snapshot()
+    os.remove(outfile.name)
+
+    counters = snapshot['counters']
+    user, system = [end - begin for begin, end in zip(cpu_start, cpu_end)]
+    stages = {}
+    for name in STAGES:
+        histogram = snapshot['histograms'].get(name)
+        if histogram:
+            stages[name] = dict((k, histogram[k])
+                                for k in ['count', 'p50', 'p90', 'p99'])
+    return {
+        'processes': processes,
+        'threads': threads,
+        'statuses': len(statuses),
+        'elapsed': elapsed,
+        'authors': counters.get('authors', 0),
+        'pages': counters.get('pages', 0),
+        'dialogs': counters.get('dialogs_written', 0),
+        'pages_per_sec': counters.get('pages', 0) / elapsed,
+        'dialogs_per_sec': counters.get('dialogs_written', 0) / elapsed,
+        'stages': stages,
+        'cpu': {'user': user, 'system': system,
+                'utilization': (user + system) / elapsed},
+    }
+
+
+def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    statuses = load_statuses(args.fixtures)
+
+    base_url = 'http://127.0.0.1:{}'.format(args.port)
+    # module globals are inherited by the forked workers
+    scraping.TWITTER_URL = base_url
+    scraping.API_URL = base_url + '/1.1'
+    server = start_server(os.path.abspath(args.fixtures), args.port)
+
+    results = []
+    print('{:>9} {:>7} {:>9} {:>11} {:>9} {:>12} {:>10} {:>8}'.format(
+        'processes', 'threads', 'dialogs', 'dialogs/sec', 'pages',
+        'pages/sec', 'p90 parse', 'cpu %'))
+    try:
+        for processes, threads in itertools.product(args.processes, args.threads):
+            result = run(statuses, processes, threads, args)
+            results.append(result)
+            parse = result['stages'].get('parse', {})
+            print('{:>9} {:>7} {:>9} {:>11.1f} {:>9} {:>12.1f} {:>10} {:>8.0f}'
+                .format(processes, threads, result['dialogs'],
+                    result['dialogs_per_sec'], result['pages'],
+                    result['pages_per_sec'],
+                    '{:.4f}'.format(parse['p90']) if parse else '-',
+                    100 * result['cpu']['utilization']))
+    finally:
+        server.terminate()
+        server.join()
+
+    with open(args.output, 'w') as f:
+        json.dump({'fixtures': os.path.abspath(args.fixtures),
+                   'engine': args.engine, 'parser': args.parser,
+                   'min_length': args.min_length,
+                   'max_length': args.max_length,
+                   'runs': results}, f, indent=2)
+    print('Results saved to {}'.format(args.output))
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fixtures', help="directory with the recorded data")
+    parser.add_argument('--processes', type=int_list, default=[1, 2, 4],
+        help="comma-separated values of --max_processes to run")
+    parser.add_argument('--threads', type=int_list, default=[2, 8],
+        help="comma-separated values of --max_threads to run")
+    parser.add_argument('--engine', choices=['threads', 'async'],
+        default='threads')
+    parser.add_argument('--parser', choices=['bs4', 'lxml'], default='bs4')
+    parser.add_argument('--min_length', type=int, default=2)
+    parser.add_argument('--max_length', type=int, default=999)
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--port', type=int, default=8321,
+        help="port of the local fixture server")
+    parser.add_argument('--output', default='bench_replay.json',
+        help="where the results are saved as JSON")
+    main(parser.parse_args())
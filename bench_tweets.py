@@ -0,0 +1,84 @@
+"""Measures the memory held by a batch of dialogs with scraping.Tweet,
+against the previous Tweet class, which had a __dict__ and kept a separate
+copy of every string it was given.
+
+Usage: python bench_tweets.py [--authors N] [--dialogs D] [--turns T]
+
+The batch mimics the results of one worker batch: N authors, each with
+D dialogs of T turns among a handful of speakers. Strings are built anew
+for every tweet, as they are when parsed from a page. Each class runs in a
+fresh process, so the RSS growth is measured in isolation.
+"""
+
+import argparse
+import multiprocessing as mp
+import random
+import resource
+import tracemalloc
+
+from scraping import Tweet
+
+
+class DictTweet:
+    def __init__(self, user, tweet_id, fullname, text, convo_id=None):
+        self.user = user
+        self.id = tweet_id
+        self.convo_id = convo_id
+        self.fullname = fullname
+        self.text = text
+
+
+def fresh(s):
+    # a new string object with the same value, like a parser would return
+    return ''.join(list(s))
+
+
+def make_batch(cls, n_authors, n_dialogs, n_turns, seed=0):
+    rng = random.Random(seed)
+    results = []
+    tweet_id = 10 ** 18
+    for a in range(n_authors):
+        speakers = [('user_%d_%d' % (a, s), 'Full Name %d %d' % (a, s))
+                    for s in range(4)]
+        for _ in range(n_dialogs):
+            convo_id = str(tweet_id)
+            dialog = []
+            for _ in range(n_turns):
+                user, fullname = rng.choice(speakers)
+                text = 'word ' * rng.randint(5, 50)
+                dialog.append(cls(user=fresh(user), tweet_id=str(tweet_id),
+                    fullname=fresh(fullname), text=text,
+                    convo_id=fresh(convo_id)))
+                tweet_id += 1
+            results.append(dialog)
+    return results
+
+
+def run(cls, args, out):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    results = make_batch(cls, args.authors, args.dialogs, args.turns)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    n_tweets = sum(len(dialog) for dialog in results)
+    out.put((cls.__name__, n_tweets, traced / n_tweets, (peak - baseline) / 1024))
+
+
+def main(args):
+    out = mp.Queue()
+    print('%-10s %8s %14s %16s' % ('class', 'tweets', 'bytes/tweet', 'RSS growth (MB)'))
+    for cls in [DictTweet, Tweet]:
+        process = mp.Process(target=run, args=(cls, args, out))
+        process.start()
+        name, n_tweets, per_tweet, rss = out.get()
+        process.join()
+        print('%-10s %8d %14.0f %16.1f' % (name, n_tweets, per_tweet, rss))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--authors', type=int, default=50)
+    parser.add_argument('--dialogs', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=6)
+    main(parser.parse_args())
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""binary_store.py:
+   A compact binary file of dialogs, read through a memory map.
+
+   One row per tweet, stored column by column:
+     tweet ids (uint64), convo ids (uint64), creation times (uint32,
+     seconds since the epoch, 0 if unknown), turn indices (uint16),
+     user ids (uint32, into the user table), language ids (uint16, into
+     the language table) and text offsets (uint64, n_rows+1 entries into
+     the UTF-8 text blob).
+   Users are interned in a user table: user offsets (uint64, n_users+1
+   entries) into a UTF-8 blob of "<screen name>\0<name>" entries.
+   Language codes are interned the same way in a language table.
+   A dialog is a run of rows starting at turn 0. Arrays are little-endian
+   and 8-byte aligned.
+
+   usage:
+     binary_store.py import corpus.tdb dialogs.csv|dialogs.json ...
+     binary_store.py export corpus.tdb dialogs.csv|dialogs.json
+
+   .csv files are the output of getdialogs.py, .json files the output
+   of collect_twitter_dialogs.py.
+
+"""
+
+import calendar
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from array import array
+from email.utils import mktime_tz, parsedate_tz
+
+if sys.byteorder != 'little':
+    raise ImportError('binary_store.py only supports little-endian machines')
+
+MAGIC = b'TDHB'
+VERSION = 1
+# magic, version, n_rows, n_users, n_langs, sections
+HEADER = struct.Struct('<4sIQQQ12Q')
+COLUMNS = ['tweet_ids', 'convo_ids', 'created_at', 'turns', 'user_ids',
+           'lang_ids', 'text_offsets'] # one entry per row
+SECTIONS = COLUMNS + ['text', 'user_offsets', 'users', 'lang_offsets', 'langs']
+TYPECODES = {'tweet_ids': 'Q', 'convo_ids': 'Q', 'created_at': 'I',
+             'turns': 'H', 'user_ids': 'I', 'lang_ids': 'H',
+             'text_offsets': 'Q', 'user_offsets': 'Q', 'lang_offsets': 'Q'}
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S +0000 %Y' # as in the API
+
+
+def parse_created_at(created_at):
+    '''
+    seconds since the epoch of an API timestamp, or 0 if unknown
+    '''
+    if not created_at:
+        return 0
+    try:
+        return calendar.timegm(time.strptime(created_at, CREATED_AT_FORMAT))
+    except ValueError:
+        parsed = parsedate_tz(created_at) # RFC 2822, as some tools write
+        return mktime_tz(parsed) if parsed else 0
+
+
+def format_created_at(seconds):
+    if seconds == 0:
+        return ''
+    return time.strftime(CREATED_AT_FORMAT, time.gmtime(seconds))
+
+
+class Interned(object):
+    '''
+      Strings stored once, in order of first use
+    '''
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def tofile(self, out, section):
+        '''
+        write the offsets (section 'offsets') or the UTF-8 blob ('blob')
+        '''
+        blob = [value.encode('utf-8') for value in self.values]
+        if section == 'blob':
+            out.write(b''.join(blob))
+            return
+        offsets = array('Q', [0])
+        for value in blob:
+            offsets.append(offsets[-1] + len(value))
+        offsets.tofile(out)
+
+
+class BinaryDialogWriter(object):
+    '''
+      Writes dialogs to a binary store. Columns are spilled to temporary
+      files every flush_rows rows, so corpora larger than memory can be
+      imported
+    '''
+    def __init__(self, path, flush_rows=1000000):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+        self.files = dict((name, open(os.path.join(self.tmpdir, name), 'wb'))
+                          for name in COLUMNS + ['text'])
+        self.columns = dict((name, array(TYPECODES[name])) for name in COLUMNS)
+        self.users = Interned()
+        self.langs = Interned()
+        self.n_rows = 0
+        self.text_size = 0
+        self.columns['text_offsets'].append(0)
+
+    def add(self, convo_id, turn, tweet_id, user, text, name='', lang='',
+            created_at=None):
+        '''
+        user is the screen name and name the display name of the author;
+        created_at is a timestamp of the API, e.g. 'Wed Oct 10 20:19:24
+        +0000 2018'. getdialogs.py doesn't record the last three
+        '''
+        user_id = self.users.get(user + '\0' + (name or ''))
+        lang_id = self.langs.get(lang or '')
+        text = text.encode('utf-8')
+        self.files['text'].write(text)
+        self.text_size += len(text)
+
+        self.columns['tweet_ids'].append(int(tweet_id))
+        self.columns['convo_ids'].append(int(convo_id))
+        self.columns['created_at'].append(parse_created_at(created_at))
+        self.columns['turns'].append(int(turn))
+        self.columns['user_ids'].append(user_id)
+        self.columns['lang_ids'].append(lang_id)
+        self.columns['text_offsets'].append(self.text_size)
+        self.n_rows += 1
+        if len(self.columns['tweet_ids']) >= self.flush_rows:
+            self.flush()
+
+    def add_dialog(self, convo_id, dialog):
+        '''
+        dialog is a list of (tweet id, screen name, text) or of
+        (tweet id, screen name, text, name, lang, created_at)
+        '''
+        for turn, tweet in enumerate(dialog):
+            self.add(convo_id, turn, *tweet)
+
+    def flush(self):
+        for name, column in self.columns.items():
+            column.tofile(self.files[name])
+            del column[:]
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+        tables = {'user_offsets': (self.users, 'offsets'),
+                  'users': (self.users, 'blob'),
+                  'lang_offsets': (self.langs, 'offsets'),
+                  'langs': (self.langs, 'blob')}
+        with open(self.path, 'wb') as out:
+            out.write(b'\0' * HEADER.size)
+            offsets = []
+            for name in SECTIONS:
+                padding = -out.tell() % 8
+                out.write(b'\0' * padding)
+                offsets.append(out.tell())
+                if name in tables:
+                    table, section = tables[name]
+                    table.tofile(out, section)
+                else:
+                    with open(os.path.join(self.tmpdir, name), 'rb') as f:
+                        shutil.copyfileobj(f, out)
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, VERSION, self.n_rows, len(self.users),
+                                  len(self.langs), *offsets))
+        shutil.rmtree(self.tmpdir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BinaryDialogStore(object):
+    '''
+      Read-only view of a binary store. The columns are memoryviews over
+      the memory map, so nothing is copied until a row is accessed
+    '''
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self.mm, 0)
+        magic, version, self.n_rows, self.n_users, self.n_langs = fields[:5]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a binary dialog store' % path)
+        offsets = dict(zip(SECTIONS, fields[5:]))
+
+        view = memoryview(self.mm)
+        def column(name, n):
+            typecode = TYPECODES[name]
+            start = offsets[name]
+            return view[start:start + n * struct.calcsize(typecode)].cast(typecode)
+
+        self.tweet_ids = column('tweet_ids', self.n_rows)
+        self.convo_ids = column('convo_ids', self.n_rows)
+        self.created_at = column('created_at', self.n_rows)
+        self.turns = column('turns', self.n_rows)
+        self.user_ids = column('user_ids', self.n_rows)
+        self.lang_ids = column('lang_ids', self.n_rows)
+        self.text_offsets = column('text_offsets', self.n_rows + 1)
+        self.user_offsets = column('user_offsets', self.n_users + 1)
+        self.lang_offsets = column('lang_offsets', self.n_langs + 1)
+        self.text_blob = view[offsets['text']:offsets['text'] + self.text_offsets[-1]]
+        self.user_blob = view[offsets['users']:offsets['users'] + self.user_offsets[-1]]
+        self.lang_blob = view[offsets['langs']:offsets['langs'] + self.lang_offsets[-1]]
+
+    def __len__(self):
+        return self.n_rows
+
+    def user(self, user_id):
+        '''
+        (screen name, name) of a user
+        '''
+        start, end = self.user_offsets[user_id], self.user_offsets[user_id + 1]
+        return tuple(bytes(self.user_blob[start:end]).decode('utf-8')
+                     .split('\0', 1))
+
+    def lang(self, i):
+        lang_id = self.lang_ids[i]
+        start, end = self.lang_offsets[lang_id], self.lang_offsets[lang_id + 1]
+        return bytes(self.lang_blob[start:end]).decode('utf-8')
+
+    def text(self, i):
+        start, end = self.text_offsets[i], self.text_offsets[i + 1]
+        return bytes(self.text_blob[start:end]).decode('utf-8')
+
+    def row(self, i):
+        '''
+        (convo id, turn, tweet id, screen name, text) of row i
+        '''
+        return (self.convo_ids[i], self.turns[i], self.tweet_ids[i],
+                self.user(self.user_ids[i])[0], self.text(i))
+
+    def tweet(self, i):
+        '''
+        row i as a tweet of the API, with the fields held by the store;
+        in_reply_to_status_id is the tweet id of the previous turn
+        '''
+        screen_name, name = self.user(self.user_ids[i])
+        reply_id = self.tweet_ids[i - 1] if self.turns[i] > 0 else None
+        return {'id': self.tweet_ids[i], 'in_reply_to_status_id': reply_id,
+                'created_at': format_created_at(self.created_at[i]),
+                'lang': self.lang(i),
+                'user': {'screen_name': screen_name, 'name': name},
+                'text': self.text(i)}
+
+    def dialogs(self, get=None):
+        '''
+        yield each dialog as a list of rows, or of get(store, i) for each
+        row i, e.g. BinaryDialogStore.tweet
+        '''
+        get = get or BinaryDialogStore.row
+        dialog = []
+        for i in range(self.n_rows):
+            if self.turns[i] == 0 and dialog:
+                yield dialog
+                dialog = []
+            dialog.append(get(self, i))
+        if dialog:
+            yield dialog
+
+    def close(self):
+        for name in ['tweet_ids', 'convo_ids', 'created_at', 'turns',
+                     'user_ids', 'lang_ids', 'text_offsets', 'user_offsets',
+                     'lang_offsets', 'text_blob', 'user_blob', 'lang_blob']:
+            getattr(self, name).release()
+        self.mm.close()
+        self.f.close()
+
+
+## conversion from/to the other formats
+
+def import_csv(writer, fn):
+    '''
+    rows of getdialogs.py: convo_id,turn,tweet_id,screen_name,text
+    '''
+    with open(fn, 'r', encoding='utf-8') as f:
+        for line in f:
+            convo_id, turn, tweet_id, user, text = line.rstrip('\n').split(',', 4)
+            writer.add(convo_id, turn, tweet_id, user, text)
+
+
+def import_json(writer, fn):
+    '''
+    dialogs of collect_twitter_dialogs.py; the first tweet id of a dialog
+    is used as its convo id
+    '''
+    dialog_set = json.load(open(fn, 'r'))
+    for tid in sorted(dialog_set.keys(), key=int):
+        dialog = dialog_set[tid]
+        writer.add_dialog(dialog[0]['id'],
+            [(tweet['id'], tweet['user']['screen_name'], tweet['text'],
+              tweet['user'].get('name'), tweet.get('lang'),
+              tweet.get('created_at'))
+             for tweet in dialog])
+
+
+def export_csv(store, fn):
+    with open(fn, 'w', encoding='utf-8') as f:
+        for i in range(len(store)):
+            row = ','.join(str(field) for field in store.row(i))
+            f.write(re.sub('[\r\n]', ' ', row) + '\n')
+
+
+def export_json(store, fn):
+    '''
+    only the fields held by the store are exported, which are the ones
+    view_dialogs.py reads
+    '''
+    dialog_set = {}
+    for dialog in store.dialogs(BinaryDialogStore.tweet):
+        dialog_set[str(dialog[-1]['id'])] = dialog
+    json.dump(dialog_set, open(fn, 'w'), indent=2)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in ['import', 'export']:
+        print ('usage: binary_store.py import corpus.tdb dialogs.csv|dialogs.json ...')
+        print ('       binary_store.py export corpus.tdb dialogs.csv|dialogs.json')
+        sys.exit(1)
+
+    command, path, files = sys.argv[1], sys.argv[2], sys.argv[3:]
+    if command == 'import':
+        with BinaryDialogWriter(path) as writer:
+            for fn in files:
+                if fn.endswith('.json'):
+                    import_json(writer, fn)
+                else:
+                    import_csv(writer, fn)
+        print ('%s: %d tweets, %d users' % (path, writer.n_rows, len(writer.users)))
+    else:
+        store = BinaryDialogStore(path)
+        for fn in files:
+            if fn.endswith('.json'):
+                export_json(store, fn)
+            else:
+                export_csv(store, fn)
+        store.close()
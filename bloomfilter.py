@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import math
+import multiprocessing as mp
+import os
+import struct
+
+
+class BloomFilter:
+    """
+    A Bloom filter whose bits live in shared memory, so processes forked
+    after its creation all see and update the same set. Sized for
+    `capacity` keys with a false-positive rate of about `error_rate`.
+    Can be saved to and restored from disk.
+    """
+
+    header = struct.Struct('<QQQ') # num_bits, num_hashes, count
+
+    def __init__(self, capacity=10000000, error_rate=0.001):
+        num_bits = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        num_hashes = int(round(num_bits / capacity * math.log(2)))
+        self._allocate(num_bits, max(num_hashes, 1))
+
+    def _allocate(self, num_bits, num_hashes):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = mp.RawArray('B', (num_bits + 7) // 8)
+        self.count = mp.RawValue('Q', 0) # keys added so far
+        self.lock = mp.Lock()
+
+    def _offsets(self, key):
+        # double hashing: offset_i = h1 + i*h2
+        digest = hashlib.md5(str(key).encode('utf-8')).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[o >> 3] & (1 << (o & 7)) for o in self._offsets(key))
+
+    def add(self, key):
+        """
+        Adds a key to the filter. Returns True if the key was not there yet,
+        False if it was (or is a false positive).
+        """
+        bits = self.bits
+        is_new = False
+        with self.lock:
+            for o in self._offsets(key):
+                mask = 1 << (o & 7)
+                if not bits[o >> 3] & mask:
+                    bits[o >> 3] |= mask
+                    is_new = True
+            if is_new:
+                self.count.value += 1
+        return is_new
+
+    def __len__(self):
+        return self.count.value
+
+    def save(self, path):
+        """
+        Writes a snapshot of the filter to path. The file is replaced
+        atomically, so a crash never leaves a truncated snapshot behind.
+        """
+        tmp_path = path + '.tmp'
+        with self.lock:
+            with open(tmp_path, 'wb') as f:
+                f.write(self.header.pack(
+                    self.num_bits, self.num_hashes, self.count.value))
+                f.write(memoryview(self.bits).cast('B'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Restores a filter saved with save(). Its size is the one in the
+        snapshot, whatever capacity and error rate it was created with.
+        """
+        bloom = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            num_bits, num_hashes, count = cls.header.unpack(
+                f.read(cls.header.size))
+            bloom._allocate(num_bits, num_hashes)
+            f.readinto(memoryview(bloom.bits).cast('B'))
+        bloom.count.value = count
+        return bloom
+
+    @classmethod
+    def open(cls, path, capacity=10000000, error_rate=0.001):
+        """
+        Restores the filter at path if there is one, or creates a new one.
+        """
+        if path and os.path.exists(path):
+            bloom = cls.load(path)
+            logging.info("Restored {} dialog ids from {}".format(len(bloom), path))
+        else:
+            bloom = cls(capacity, error_rate)
+        return bloom
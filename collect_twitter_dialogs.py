@@ -18,27 +18,112 @@ import os
 import re
 import time
 import logging
-from requests_oauthlib import OAuth1Session
+from concurrent.futures import ThreadPoolExecutor
+import twitter_api
+from credentials import get_session_pool
 from twitter_api import GETStatusesUserTimeline
 from twitter_api import GETStatusesLookup
-
-try:
-    from configparser import ConfigParser
-except ImportError:
-    from ConfigParser import SafeConfigParser as ConfigParser
+from twitter_api import RetryPolicy
+from reply_index import ReplyIndex
+from dialog_store import STORES
 
 # create logger object
 logger = logging.getLogger("root")
 logger.setLevel(logging.INFO)
 
+def extended_dialog(dialog, name, since_id):
+    '''
+    the id of the stored dialog that dialog extends, if any. Stored dialogs
+    end in a tweet of the account up to since_id, and the latest of those
+    in dialog ends the one it extends (older ones were superseded by it)
+    '''
+    stored = [tweet for tweet in dialog[:-1]
+              if since_id is not None and tweet['id'] <= since_id
+              and tweet['user']['screen_name'].lower() == name.lower()]
+    return [str(stored[-1]['id'])] if stored else []
+
+
+def CollectDialogs(name, args, session):
+    '''
+    collect the dialogs of one account and store them in <name>.json;
+    returns the number of dialogs stored and how many were already there
+    '''
+    # setup API objects (they keep per-call state, so one set per account)
+    get_user_timeline = GETStatusesUserTimeline(session)
+    get_user_timeline.setParams(target_count=args.count, reply_only=True)
+    get_lookup = GETStatusesLookup(session)
+
+    path = name
+    if args.outdir:
+        path = os.path.join(args.outdir, path)
+
+    ## collect tweets from an account
+    logger.info('collecting tweets from ' + name)
+    store = STORES[args.format](path)
+    outfile = store.path
+    if len(store) > 0:
+        logger.info('restoring acquired tweets from ' + outfile)
+    since_id = store.since_id()
+    num_past_dialogs = len(store)
+
+    get_user_timeline.setParams(name, max_id=None, since_id=since_id)
+    get_user_timeline.waitReady()
+    timeline_tweets = get_user_timeline.call()
+    if timeline_tweets is None:
+        logger.warn('skip %s with an error' % name)
+        return len(store), num_past_dialogs
+
+    logger.info('obtained %d new tweet(s) from %s' % (len(timeline_tweets), name))
+    if len(timeline_tweets) == 0:
+        logger.info('no dialogs have been added to ' + outfile)
+        return len(store), num_past_dialogs
+
+    ## collect source tweets
+    logger.info("collecting source tweets in reply recursively for " + name)
+    tweet_index = ReplyIndex()
+    ## to avoid getting same tweets again, add tweets we aready have
+    for dialog in store.known_dialogs():
+        tweet_index.add(dialog)
+    ## add new tweets and collect reply-ids as necessary
+    source_ids = tweet_index.add(timeline_tweets)
+    ## acquire source tweets
+    get_lookup.waitReady()
+    while len(source_ids) > 0:
+        start_time = time.time()
+        result = get_lookup.callConcurrently(source_ids, args.lookup_workers)
+        logger.info('obtained %d/%d tweets in %.2f seconds'
+                    % (len(result), len(source_ids), time.time() - start_time))
+        source_ids = tweet_index.add(result)
+
+    ## reconstruct dialogs
+    logger.info("restructuring the collected tweets of %s as a set of dialogs" % name)
+    dialog_set = {}
+    superseded = set()
+    for tid, dialog in tweet_index.dialogs(timeline_tweets):
+        # if there already exists a dialog associated with a source tweet,
+        # the dialog is deleted because it's not a complete dialog.
+        for tweet in dialog[:-1]:
+            dialog_set.pop(str(tweet['id']), None)
+        superseded.update(extended_dialog(dialog, name, since_id))
+
+        # add the dialog only if it contains two or more turns,
+        # where it is associated with its terminal tweet id.
+        if len(dialog) > 1:
+            dialog_set[str(tid)] = dialog
+    new_dialogs = len(dialog_set)
+
+    logger.info('obtained %d new dialogs from %s' % (new_dialogs, name))
+    if new_dialogs > 0:
+        logger.info('writing to file %s' % outfile)
+        store.update(dialog_set, superseded)
+    else:
+        logger.info('no dialogs have been added to ' + outfile)
+
+    return len(store), num_past_dialogs
+
+
 def Main(args):
-    # get access keys from a config file
-    config = ConfigParser()
-    config.read(args.config)
-    ConsumerKey = config.get('AccessKeys','ConsumerKey')
-    ConsumerSecret = config.get('AccessKeys','ConsumerSecret')
-    AccessToken = config.get('AccessKeys','AccessToken')
-    AccessTokenSecret = config.get('AccessKeys','AccessTokenSecret')
+    twitter_api.REST_API_URL = args.api_url
 
     # obtain targets
     targets = args.names
@@ -53,131 +138,51 @@ def Main(args):
         if not os.path.exists(args.outdir):
             os.mkdir(args.outdir)
 
-    # open a session
-    session = OAuth1Session(ConsumerKey, ConsumerSecret, AccessToken, AccessTokenSecret)
-
-    # setup API object
-    get_user_timeline = GETStatusesUserTimeline(session)
-    get_user_timeline.setParams(target_count=args.count, reply_only=True)
-    get_lookup = GETStatusesLookup(session)
+    # open a session for each set of access keys in the config files
+    session = get_session_pool(args.config or ['config.ini'])
 
-    # collect dialogs from each target
+    # collect dialogs from each target; API objects using the same session
+    # share its rate limits, so the jobs never exceed them together
     num_dialogs = 0
     num_past_dialogs = 0
+    start_time = time.time()
 
-    for name in targets:
-        logger.info('-----------------------------')
-        outfile = name + '.json'
-        if args.outdir:
-            outfile = os.path.join(args.outdir, outfile)
-
-        ## collect tweets from an account
-        logger.info('collecting tweets from ' + name)
-        if os.path.exists(outfile):
-            logger.info('restoring acquired tweets from ' + outfile)
-            dialog_set = json.load(open(outfile,'r'))
-            since_id = max([int(s) for s in dialog_set.keys()])
-            num_past_dialogs += len(dialog_set)
-        else:
-            since_id = None
-            dialog_set = {}
-
-        get_user_timeline.setParams(name, max_id=None, since_id=since_id)
-        get_user_timeline.waitReady()
-        timeline_tweets = get_user_timeline.call()
-        if timeline_tweets is None:
-            logger.warn('skip %s with an error' % name)
-            num_dialogs += len(dialog_set)
-            continue
-
-        logger.info('obtained %d new tweet(s)' % len(timeline_tweets))
-        if len(timeline_tweets) == 0:
-            logger.info('no dialogs have been added to ' + outfile)
-            num_dialogs += len(dialog_set)
-            continue
-
-        ## collect source tweets
-        logger.info("collecting source tweets in reply recursively")
-        tweet_set = {}
-        ## to avoid getting same tweets again, add tweets we aready have
-        for tid,dialog in dialog_set.items():
-            for tweet in dialog:
-                tweet_set[tweet['id']] = tweet
-        ## add new tweets and collect reply-ids as necessary
-        source_ids = set()
-        for tweet in timeline_tweets:
-            tweet_set[tweet['id']] = tweet
-            reply_id = tweet['in_reply_to_status_id']
-            if reply_id is not None and reply_id not in tweet_set:
-                source_ids.add(reply_id)
-        ## acquire source tweets
-        get_lookup.waitReady()
-        while len(source_ids) > 0:
-            get_lookup.setParams(source_ids)
-            result = get_lookup.call()
-            logger.info('obtained %d/%d tweets' % (len(result),len(source_ids)))
-            new_source_ids = set()
-            for tweet in result:
-                tweet_set[tweet['id']] = tweet
-                reply_id = tweet['in_reply_to_status_id']
-                if reply_id is not None and reply_id not in tweet_set:
-                    new_source_ids.add(reply_id)
-            source_ids = new_source_ids
-
-        ## reconstruct dialogs
-        logger.info("restructuring the collected tweets as a set of dialogs")
-        visited = set()
-        new_dialogs = 0
-        for tweet in timeline_tweets:
-            tid = tweet['id']
-            if tid not in visited: # ignore visited node (it's not a terminal)
-                visited.add(tid)
-                # backtrack source tweets and make a dialog
-                dialog = [tweet]
-                reply_id = tweet_set[tid]['in_reply_to_status_id']
-                while reply_id is not None:
-                    visited.add(reply_id)
-                    # if there already exists a dialog associated with reply_id,
-                    # the dialog is deleted because it's not a complete dialog.
-                    if str(reply_id) in dialog_set:
-                        del dialog_set[str(reply_id)]
-                    # insert a source tweet to the dialog
-                    if reply_id in tweet_set:
-                        dialog.insert(0,tweet_set[reply_id])
-                    else:
-                        break
-                    # move to the previous tweet
-                    reply_id = tweet_set[reply_id]['in_reply_to_status_id']
-
-                # add the dialog only if it contains two or more turns,
-                # where it is associated with its terminal tweet id.
-                if len(dialog) > 1:
-                    dialog_set[str(tid)] = dialog
-                    new_dialogs += 1
-
-        logger.info('obtained %d new dialogs' % new_dialogs)
-        if new_dialogs > 0:
-            logger.info('writing to file %s' % outfile)
-            json.dump(dialog_set, open(outfile,'w'), indent=2)
-        else:
-            logger.info('no dialogs have been added to ' + outfile)
-
-        num_dialogs += len(dialog_set)
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(CollectDialogs, name, args, session)
+                   for name in targets]
+        for future in futures:
+            n_dialogs, n_past_dialogs = future.result()
+            num_dialogs += n_dialogs
+            num_past_dialogs += n_past_dialogs
 
+    hours = (time.time() - start_time) / 3600
     logger.info('-----------------------------')
     logger.info('obtained %d new dialogs' % (num_dialogs - num_past_dialogs))
     logger.info('now you have %d dialogs in total' % num_dialogs)
+    logger.info('%.1f accounts/hour, %.1f new dialogs/hour'
+                % (len(targets) / hours, (num_dialogs - num_past_dialogs) / hours))
+    RetryPolicy.of(session).report()
 
 
 if __name__ =="__main__":
     # parse command line
     parser = argparse.ArgumentParser()
-    parser.add_argument('-c', '--config', default='config.ini', help="config file")
+    parser.add_argument('-c', '--config', action='append',
+                        help="config file (can be repeated to use several credentials)")
     parser.add_argument('-t', '--target', help="read account names from a file")
     parser.add_argument('-o', '--outdir', help="output directory")
     parser.add_argument('-l', '--logfile', help="set a log file")
     parser.add_argument('-n', '--count', default=-1, type=int,
                         help="maximum number of tweets acquired from each account")
+    parser.add_argument('-f', '--format', choices=['json', 'jsonl'], default='json',
+                        help="storage of the dialogs: one JSON file rewritten on each run, "
+                             "or append-only JSON lines with an index (see dialog_store.py)")
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+                        help="number of accounts collected at once")
+    parser.add_argument('-w', '--lookup_workers', default=8, type=int,
+                        help="maximum number of concurrent lookup requests")
+    parser.add_argument('--api_url', default=twitter_api.REST_API_URL,
+                        help="base URL of the REST API (e.g. a local stand-in)")
     parser.add_argument('-d', '--debug', action='store_true', help="debug mode")
     parser.add_argument('-s', '--silent', action='store_true', help="silent mode")
     parser.add_argument('names', metavar='NAME', nargs='*', help='account names')
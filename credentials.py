@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""credentials.py:
+   Load several sets of access keys into a pool of sessions.
+
+   A config file may hold any number of sections whose name starts with
+   AccessKeys (e.g. [AccessKeys], [AccessKeys2], ...), and any number of
+   config files can be given. Each section becomes one session.
+
+"""
+
+import logging
+from requests_oauthlib import OAuth1Session
+from twitter_api import SessionPool
+
+try:
+    from configparser import ConfigParser
+except ImportError:
+    from ConfigParser import SafeConfigParser as ConfigParser
+
+logger = logging.getLogger('root')
+
+
+def get_sessions(config_path):
+    config = ConfigParser()
+    config.read(config_path)
+    sessions = []
+    for section in config.sections():
+        if not section.startswith('AccessKeys'):
+            continue
+        ConsumerKey = config.get(section,'ConsumerKey')
+        ConsumerSecret = config.get(section,'ConsumerSecret')
+        AccessToken = config.get(section,'AccessToken')
+        AccessTokenSecret = config.get(section,'AccessTokenSecret')
+        sessions.append(OAuth1Session(ConsumerKey, ConsumerSecret,
+                                      AccessToken, AccessTokenSecret))
+    return sessions
+
+
+def get_session_pool(config_paths):
+    sessions = []
+    for config_path in config_paths:
+        sessions.extend(get_sessions(config_path))
+    if len(sessions) == 0:
+        raise Exception('no AccessKeys found in %s' % ', '.join(config_paths))
+    logger.info('using %d set(s) of credentials' % len(sessions))
+    return SessionPool(sessions)
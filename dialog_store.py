@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""dialog_store.py:
+   Storage of the dialogs collected from an account.
+
+   JSONDialogStore is the original <name>.json format: one JSON object
+   mapping terminal tweet ids to dialogs, rewritten on every update.
+
+   JSONLinesDialogStore appends one {"id": ..., "dialog": [...]} record per
+   line to <name>.jsonl. A sidecar <name>.idx.json holds the max tweet id,
+   the number of records and the ids of the dialogs superseded by longer
+   ones, so an update reads the index only and appends new records.
+
+   usage: dialog_store.py account.json ...
+   converts JSON dialog files to JSON lines, next to the original files.
+
+"""
+
+import json
+import os
+import sys
+
+
+class JSONDialogStore(object):
+    extension = '.json'
+
+    def __init__(self, path):
+        self.path = path + self.extension
+        if os.path.exists(self.path):
+            self.dialog_set = json.load(open(self.path,'r'))
+        else:
+            self.dialog_set = {}
+
+    def __len__(self):
+        return len(self.dialog_set)
+
+    def since_id(self):
+        if len(self.dialog_set) == 0:
+            return None
+        return max([int(s) for s in self.dialog_set.keys()])
+
+    def known_dialogs(self):
+        '''
+        dialogs whose tweets don't need to be acquired again
+        '''
+        return self.dialog_set.values()
+
+    def update(self, new_dialogs, superseded):
+        for tid in superseded:
+            self.dialog_set.pop(tid, None)
+        self.dialog_set.update(new_dialogs)
+        json.dump(self.dialog_set, open(self.path,'w'), indent=2)
+
+
+class JSONLinesDialogStore(object):
+    extension = '.jsonl'
+
+    def __init__(self, path):
+        self.path = path + self.extension
+        self.index_path = path + '.idx.json'
+        if os.path.exists(self.index_path):
+            index = json.load(open(self.index_path,'r'))
+        else:
+            index = {'since_id': None, 'records': 0, 'superseded': []}
+        self.max_id = index['since_id']
+        self.superseded = set(index['superseded'])
+        self.n_records = index['records']
+
+    def __len__(self):
+        '''
+        the number of live dialogs
+        '''
+        return self.n_records - len(self.superseded)
+
+    def since_id(self):
+        return self.max_id
+
+    def known_dialogs(self):
+        return [] # the point is not to read them
+
+    def update(self, new_dialogs, superseded):
+        # superseded holds the ids of stored dialogs, which are at most
+        # max_id; new dialogs come after it
+        self.superseded.update(tid for tid in superseded
+                               if self.max_id is not None
+                               and int(tid) <= self.max_id
+                               and tid not in new_dialogs)
+
+        with open(self.path, 'a') as f:
+            for tid, dialog in new_dialogs.items():
+                f.write(json.dumps({'id': tid, 'dialog': dialog}) + '\n')
+                self.superseded.discard(tid)
+        self.n_records += len(new_dialogs)
+
+        if len(new_dialogs) > 0:
+            self.max_id = max([self.max_id or 0] +
+                              [int(s) for s in new_dialogs.keys()])
+        self.writeIndex()
+
+    def writeIndex(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'since_id': self.max_id,
+                       'records': self.n_records,
+                       'superseded': sorted(self.superseded, key=int)}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def __iter__(self):
+        '''
+        yield (terminal id, dialog) for each live dialog, in the order
+        they were stored
+        '''
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['id'] not in self.superseded:
+                    yield record['id'], record['dialog']
+
+
+STORES = {'json': JSONDialogStore, 'jsonl': JSONLinesDialogStore}
+
+
+def convert(json_path):
+    '''
+    convert a JSON dialog file to JSON lines with its index
+    '''
+    path = os.path.splitext(json_path)[0]
+    dialog_set = json.load(open(json_path,'r'))
+    store = JSONLinesDialogStore(path)
+    if len(store) > 0:
+        raise Exception('%s already exists' % store.path)
+    store.update(dialog_set, ())
+    return store
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print ('usage: dialog_store.py dialogs.json ...')
+        sys.exit(1)
+
+    for fn in sys.argv[1:]:
+        store = convert(fn)
+        print ('%s: %d dialogs -> %s' % (fn, len(store), store.path))
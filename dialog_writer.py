@@ -0,0 +1,107 @@
+import logging
+import multiprocessing as mp
+import queue
+import signal
+
+from time import time
+
+
+class DialogWriter:
+    """
+    Owns the output file in a dedicated process. Other processes hand it
+    chunks of text through a queue, which never blocks them. The writer
+    accumulates chunks and writes them in large blocks, whenever
+    flush_size bytes are pending or flush_interval seconds have passed.
+    The time of each write is observed in metrics, if given.
+
+    Ctrl-C reaches the whole process group, so the writer ignores SIGINT:
+    the main process stops it with close(), after the workers, and the
+    buffer is written then. Rows lost here would stay marked as collected
+    in the Bloom filter.
+    """
+
+    def __init__(self, outfile_path, flush_size=1 << 20, flush_interval=5.0,
+        report_interval=60.0, metrics=None):
+        self.outfile_path = outfile_path
+        self.metrics = metrics
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+
+        self.queue = mp.Queue() # unbounded, so put() never waits for disk
+        self.process = mp.Process(target=self._run, daemon=True)
+
+    def start(self):
+        self.process.start()
+
+    def write(self, text):
+        self.queue.put(text)
+
+    def close(self):
+        """
+        Writes whatever is pending and stops the writer process.
+        """
+        self.queue.put(None)
+        self.process.join()
+
+    def _queue_depth(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError: # macOS
+            return -1
+
+    def _run(self):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        logger = logging.getLogger('Writer')
+
+        buffer = []
+        buffer_size = 0
+        n_chunks = n_bytes = 0 # totals since the writer started
+        start = last_flush = last_report = time()
+
+        with open(self.outfile_path, 'ab') as outfile:
+            try:
+                while True:
+                    try:
+                        text = self.queue.get(timeout=self.flush_interval)
+                    except queue.Empty:
+                        text = ''
+
+                    if text is None: # sentinel sent by close()
+                        break
+
+                    if text:
+                        chunk = text.encode('utf-8')
+                        buffer.append(chunk)
+                        buffer_size += len(chunk)
+                        n_chunks += 1
+
+                    now = time()
+                    if buffer_size >= self.flush_size or \
+                        (buffer and now - last_flush >= self.flush_interval):
+                        write_start = time()
+                        outfile.write(b''.join(buffer))
+                        outfile.flush()
+                        if self.metrics:
+                            self.metrics.observe('disk_write', time() - write_start)
+                            self.metrics.count('bytes_written', buffer_size)
+                            self.metrics.flush()
+                        n_bytes += buffer_size
+                        buffer = []
+                        buffer_size = 0
+                        last_flush = now
+
+                    if now - last_report >= self.report_interval:
+                        logger.info("Received {} chunks, wrote {:.1f} MB ({:.1f} KB/s), "
+                            "{} chunks queued".format(n_chunks, n_bytes / 1e6,
+                                n_bytes / 1e3 / (now - start), self._queue_depth()))
+                        last_report = now
+            finally: # also when the writer fails
+                outfile.write(b''.join(buffer))
+                n_bytes += buffer_size
+                if self.metrics:
+                    self.metrics.count('bytes_written', buffer_size)
+                    self.metrics.flush()
+
+        logger.info("Writer terminated after {} chunks, {:.1f} MB written."
+            .format(n_chunks, n_bytes / 1e6))
@@ -2,20 +2,31 @@
 
 
 import tweepy
+import json
 import logging
+import scraping
 import threading
 import multiprocessing as mp
 import argparse
 import traceback
 import twitter_dialogs
 import re
+import queue
 import requests
 from time import sleep
 
+from requests.adapters    import HTTPAdapter
 from requests_futures.sessions import FuturesSession
 from scraping             import Tweet
+from bloomfilter          import BloomFilter
+from dialog_writer        import DialogWriter
+from author_cache         import AuthorCache
+from metrics              import Metrics
+from profiling            import Profiler
+from adaptive_limit       import AdaptiveLimit
+from ring_buffer          import RingBuffer
 from time                 import time, sleep
-from concurrent.futures   import ThreadPoolExecutor
+from concurrent.futures   import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from configparser         import ConfigParser
 from en_top100            import top100 as top100_english
 from collections          import deque
@@ -30,7 +41,13 @@ class StreamListener(tweepy.StreamListener):
     """
 
     def __init__(self, outfile_path, config_path, max_threads,
-        max_processes, min_length, max_length, num_speakers=None):
+        max_processes, min_length, max_length, num_speakers=None,
+        engine='threads', max_concurrency=200, timeout=10, parser='bs4',
+        bloom_path=None, bloom_capacity=10000000, bloom_error_rate=0.001,
+        author_cache_path=None, author_ttl=21600, author_cache_size=100000,
+        metrics_port=None, metrics_path=None, metrics_interval=60,
+        profile=None, profile_dir='profiles', profile_interval=300,
+        adaptive=False, min_concurrency=1):
         super().__init__()
         
         self.tweet_pool = deque()
@@ -39,7 +56,12 @@ class StreamListener(tweepy.StreamListener):
         self.batch_pool = mp.Queue(20) # holds max 20 batches a time
         self.batch_size = 5
 
-        self.outfile = open(outfile_path, 'a', encoding='utf-8')
+        # counters and latencies of the pipeline stages, from all processes
+        self.metrics = Metrics()
+
+        # a single process appends the dialogs to the output file
+        self.writer = DialogWriter(outfile_path, metrics=self.metrics)
+        self.writer.start()
         # self.session = twitter_dialogs.get_session(config_path)
 
         self.min_length = min_length
@@ -50,17 +72,80 @@ class StreamListener(tweepy.StreamListener):
         self.max_processes = max_processes
         self.processes = []
 
+        # how pages are downloaded: 'threads' or 'async'
+        self.engine = engine
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.parser = parser # 'bs4' or 'lxml'
+
+        # with adaptive, the number of concurrent downloads of each process
+        # moves between min_concurrency and max_threads (or max_concurrency
+        # with the async engine), following errors and latency
+        self.adaptive = adaptive
+        self.min_concurrency = min_concurrency
+        self.failure_pause = 5 # seconds to wait after a failed download
+                               # when concurrency can't go any lower
+
+        # ids of the first tweet of every dialog written so far, shared by
+        # all worker processes and periodically saved to bloom_path
+        self.bloom_path = bloom_path
+        self.bloom = BloomFilter.open(bloom_path, bloom_capacity,
+            bloom_error_rate)
+        self.bloom_saved = mp.Value('d', time()) # time of the last snapshot
+        self.bloom_interval = 60 # seconds between snapshots
+
+        # authors scanned in the last author_ttl seconds are not scanned again
+        # (all authors go through enqueue_tweet, so the cache lives here)
+        self.author_cache_path = author_cache_path
+        self.author_cache = AuthorCache.open(author_cache_path, author_ttl,
+            author_cache_size)
+        self.author_cache_saved = time()
+        self.author_cache_interval = 300 # seconds between snapshots
+
+        # 'cprofile' or 'sample' runs each process under a profiler, which
+        # dumps <profile_dir>/<worker|stream>-<pid>.prof periodically
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.profile_interval = profile_interval
+        self.profiler = None # the profiler of the current process
+
+        # the stream can be read in a process of its own (see start_reader),
+        # which hands the authors of replies to this one through the ring
+        self.ring = RingBuffer()
+        self.reader = None
+        self.reading = False # True in the reader process
+        self.flag_stop_reading = mp.RawValue('b', False) # checked per status
+        self.metrics_flushed_at = time()
+
+        # rates of the stream, logged every report_interval seconds
+        self.report_interval = 60
+        self.reported_at = time()
+        self.reported_counts = (0, 0) # statuses and stall warnings so far
+        self.n_statuses = 0
+        self.n_stall_warnings = 0
+
         self.flag_terminate = mp.Value('b', False) # tells process to terminate
+        self.poll_interval = 1.0 # max. seconds a worker blocks before rechecking
 
         for i in range(max_processes):
-            process = mp.Process(target=self._consume,
+            process = mp.Process(target=self._work,
                 args=(self.batch_pool,), daemon=True)
             self.processes.append(process)
             process.start()
 
-    def write_dialogs(self, dialogs):
-        logging.info("Flushing {} dialogs..".format(len(dialogs)))
+        # the metrics are published from this process only
+        if metrics_port:
+            self.metrics.serve(metrics_port)
+            logging.info("Serving metrics on http://127.0.0.1:{}/".format(
+                metrics_port))
+        if metrics_path:
+            self.metrics.save_every(metrics_path, metrics_interval)
 
+    def write_dialogs(self, dialogs):
+        """
+        Hands the dialogs to the writer process as one chunk of rows.
+        """
+        rows = []
         for dialog in dialogs:
             for i, tweet in enumerate(dialog):
                 fields = [
@@ -70,31 +155,91 @@ class StreamListener(tweepy.StreamListener):
                     tweet.user,
                     self.clean_message(tweet.text)
                 ]
-                row = ','.join(fields)
-                self.outfile.write(row +'\n')
-            self.outfile.flush()
+                rows.append(','.join(fields) + '\n')
 
-        logging.info("Flushing completed.")
+        if rows:
+            self.writer.write(''.join(rows))
+            logging.info("Queued {} dialogs for writing.".format(len(dialogs)))
 
-    def enqueue_tweet(self, tweet):
+    def enqueue_tweet(self, screen_name, tweet_id):
         # tweet_pool works like a conveyor belt
         # hold max 10*batch_size tweets at a time
         # when an empty slot appears in batch_pool, a number of tweets are
         # removed from tweet_pool and put in batch_pool for consumption
-        self.tweet_pool.append(tweet)
+        # tweets are (screen_name, tweet_id) pairs: that's all the workers need
+        if self.author_cache.seen_recently(screen_name):
+            self.metrics.count('authors_skipped')
+            return
+
+        self.tweet_pool.append((screen_name, tweet_id))
         
         if len(self.tweet_pool) > 10*self.batch_size:
             self.tweet_pool.popleft()
+            self.metrics.count('tweets_dropped')
 
         # if there's room in the batch_pool and we have enough tweets for a new
         # batch, then enqueue a new batch
         if not self.batch_pool.full() and \
             len(self.tweet_pool) >= self.batch_size:
+            self._queue_batch(self.batch_size)
 
-            batch = []
-            for _ in range(self.batch_size):
-                batch.append(self.tweet_pool.popleft())
-            self.batch_pool.put(batch)
+            if time() - self.author_cache_saved >= self.author_cache_interval:
+                self.save_author_cache()
+
+    def queue_remaining(self):
+        """
+        Queues the tweets left in tweet_pool, fewer than a batch, e.g.
+        before close(drain=True) at the end of a replay. Blocks while
+        batch_pool is full.
+        """
+        if self.tweet_pool:
+            self._queue_batch(len(self.tweet_pool))
+
+    def _queue_batch(self, size):
+        batch = []
+        for _ in range(size):
+            tweet = self.tweet_pool.popleft()
+            self.author_cache.add(tweet[0])
+            batch.append(tweet)
+        self.batch_pool.put(batch)
+        self.metrics.count('batches_queued')
+        self.metrics.gauge('batch_pool_depth', self._batch_pool_depth())
+
+    def _batch_pool_depth(self):
+        try:
+            return self.batch_pool.qsize()
+        except NotImplementedError: # macOS
+            return -1
+
+    def save_author_cache(self):
+        cache = self.author_cache
+        logging.info("Author cache: {} hits, {} misses ({:.0%} skipped), "
+            "{} authors.".format(cache.hits, cache.misses,
+                cache.hits / max(cache.hits + cache.misses, 1), len(cache)))
+        self.author_cache_saved = time()
+        if self.author_cache_path:
+            cache.save(self.author_cache_path)
+
+    def start_profiler(self, name):
+        """
+        Profiles the calling thread, if profiling is on.
+        """
+        if self.profile:
+            self.profiler = Profiler(self.profile_dir, name, self.profile,
+                self.profile_interval)
+            self.profiler.start()
+
+    def stop_profiler(self):
+        if self.profiler:
+            self.profiler.stop()
+            self.profiler = None
+
+    def _work(self, batch_pool):
+        self.start_profiler('worker')
+        try:
+            self._consume(batch_pool)
+        finally:
+            self.stop_profiler()
 
     def _consume(self, batch_pool):
         """
@@ -105,99 +250,319 @@ class StreamListener(tweepy.StreamListener):
         process_id = mp.current_process()._identity[0]
         logger = logging.getLogger('Process ' + str(process_id))
 
-        while not self.flag_terminate.value:
-            if batch_pool.empty(): continue
+        # seconds spent waiting for batches vs. working on them
+        idle_time = 0.0
+        busy_time = 0.0
+
+        # one keep-alive session for the whole life of the process, so page
+        # downloads reuse the TCP/TLS connections to twitter.com
+        if self.engine == 'async':
+            from async_fetcher import AsyncFetcher
+            fetcher = AsyncFetcher(self.max_concurrency, self.timeout)
+            max_concurrency = self.max_concurrency
+        else:
+            session, adapter = get_futures_session(self.max_threads)
+            max_concurrency = self.max_threads
+
+        if self.adaptive:
+            limit = AdaptiveLimit(max(self.min_concurrency, max_concurrency // 2),
+                self.min_concurrency, max_concurrency)
+        else:
+            limit = AdaptiveLimit(max_concurrency, max_concurrency,
+                max_concurrency) # never moves
 
-            tweets = batch_pool.get()
+        while not self.flag_terminate.value:
+            # block until a batch arrives; the timeout lets us notice
+            # flag_terminate even if no sentinel was put in the queue
+            wait_start = time()
+            try:
+                tweets = batch_pool.get(timeout=self.poll_interval)
+            except queue.Empty:
+                idle_time += time() - wait_start
+                continue
+            idle_time += time() - wait_start
+
+            if tweets is None: # sentinel sent by close()
+                break
+
+            work_start = time()
             results = [] # all dialogs from the batch
             dialog_refs = dict() # stores the id of the first tweet in dialogs
 
             logger.info("Opened new batch containing {} tweets"\
                 .format(len(tweets)))
 
-            for tweet in tweets:
+            for author, tweet_id in tweets:
                 # get timeline tweets using official API
-                author = tweet.user.screen_name
 
                 logger.info("Started scanning {}'s timeline.".format(author))
 
                 # timeline_tweets = twitter_dialogs.get_timeline_tweets(
                     # self.session, author, 100, reply_only=True)
-                timeline_tweets = Tweet.from_timeline(author, max_count=500)
+                with self.metrics.timer('timeline'):
+                    timeline_tweets = list(
+                        Tweet.from_timeline(author, max_count=500))
+                self.metrics.count('authors')
 
                 if not timeline_tweets:
                     logger.warning("Unable to fetch {}'s timeline".format(author))
                     continue
 
+                # replies in the same conversation share a page, so fetch only
+                # the page of the latest one
+                thread_tweets = Tweet.latest_per_conversation(timeline_tweets)
+                logger.info("{} tweets in {} conversations, skipped {} fetches."
+                    .format(len(timeline_tweets), len(thread_tweets),
+                        len(timeline_tweets) - len(thread_tweets)))
+
                 # each dialog has a url
                 # (e.g., https://twitter.com/ABakerN7/status/922558430640070658)
-                # use requests_futures to download pages async
-                # and bs4 to scrap them
-
-                session = FuturesSession(
-                    executor=ThreadPoolExecutor(max_workers=self.max_threads))
-                futures = []
-                for i, timeline_tweet in enumerate(timeline_tweets):
-                    url = 'https://twitter.com/i/web/status/{}'\
-                        .format(timeline_tweet.id)
-                    futures.append((url, session.get(url)))
-
-                # parse each dialog with bs4
+                # download pages concurrently and scrap them
+                urls = ['{}/i/web/status/{}'.format(scraping.TWITTER_URL, t.id)
+                        for t in thread_tweets]
+                pages_start = time()
+                if self.engine == 'async':
+                    pages = fetcher.fetch_all(urls, int(limit))
+                else:
+                    pages = self._fetch_threaded(session, urls, limit)
+
+                # parse each dialog
                 dialogs = []
-                for url, future in futures:
-                    try:
-                        response = future.result()
-                        if response.status_code != 200:
-                            logging.info("{} returned {}".format(url, response.status_code))
-                            continue
-                        html = response.text
-                        dialog = list(Tweet.from_conversation(html))
-
-                        if len(dialog) == 0:
-                            continue
-
-                        # check if we already got this dialog
-                        if dialog[0].id in dialog_refs:
-                            continue
-
-                        # check if this dialog has the desired number of speakers
-                        speakers = set([tweet.user for tweet in dialog])
-                        if self.num_speakers and len(speakers) != self.num_speakers:
-                            continue
-
-                        dialogs.append(dialog)
-                        dialog_refs[dialog[0].id] = True
-                    except requests.exceptions.ConnectionError as e:
+                for url, status_code, html, seconds in pages:
+                    self.metrics.count('pages')
+                    self.metrics.count('page_status_{}'.format(
+                        status_code or 'error'))
+                    self.metrics.observe('page_fetch', seconds)
+
+                    change = limit.record(status_code, seconds)
+                    if change:
+                        self.metrics.count('concurrency_' + change)
+                        logger.info("Concurrency {}d to {} after {} ({:.2f}s)"
+                            .format(change + 'd', int(limit),
+                                status_code or 'a failed request', seconds))
+
+                    if status_code is None:
                         # twitter probably rejected the request
-                        # wait a moment
-                        logging.error(str(e))
-                        sleep(5)
-
-                    except Exception as e:
-                        # logging.error("Unable to parse {}".format(url))
-                        raise
+                        if limit.at_minimum():
+                            sleep(self.failure_pause) # wait a moment
+                        continue # already logged
+                    if status_code != 200:
+                        logging.info("{} returned {}".format(url, status_code))
+                        continue
+                    with self.metrics.timer('parse'):
+                        dialog = list(Tweet.from_conversation(html, self.parser))
+
+                    if len(dialog) == 0:
+                        self.metrics.count('pages_without_dialog')
+                        continue
+
+                    # check if we already got this dialog
+                    if dialog[0].id in dialog_refs:
+                        self.metrics.count('dialogs_rejected_duplicate')
+                        continue
+
+                    # check if this dialog has the desired number of speakers
+                    speakers = set([tweet.user for tweet in dialog])
+                    if self.num_speakers and len(speakers) != self.num_speakers:
+                        self.metrics.count('dialogs_rejected_speakers')
+                        continue
+
+                    dialogs.append(dialog)
+                    dialog_refs[dialog[0].id] = True
+
+                # time to download and parse all the pages of an author
+                self.metrics.observe('pages', time() - pages_start)
 
                 n_valid = 0
+                n_duplicates = 0
 
                 for dialog in dialogs:
                     if self.min_length <= len(dialog) <= self.max_length:
+                        # check if any process already wrote this dialog
+                        if not self.bloom.add(dialog[0].id):
+                            n_duplicates += 1
+                            continue
                         n_valid += 1
                         results.append(dialog)
+                    else:
+                        self.metrics.count('dialogs_rejected_length')
+                self.metrics.count('dialogs_rejected_duplicate', n_duplicates)
+
+                logger.info("Got {} dialogs from {}, {} are valid, {} are "
+                    "duplicates.".format(len(dialogs), author, n_valid,
+                        n_duplicates))
+
+            with self.metrics.timer('write'):
+                self.write_dialogs(results)
+            self.metrics.count('dialogs_written', len(results))
+            self.save_bloom()
+
+            busy_time += time() - work_start
+            self.metrics.observe('batch', time() - work_start)
+            self.metrics.gauge('concurrency_process_{}'.format(process_id),
+                int(limit))
+            self.metrics.flush()
+            if self.profiler:
+                self.profiler.maybe_dump()
+            logger.info("Idle {:.1f}s, busy {:.1f}s ({:.0%} busy), "
+                "concurrency {}".format(idle_time, busy_time,
+                    busy_time / (idle_time + busy_time), int(limit)))
+
+            if self.engine != 'async':
+                n_requests, n_connections = connection_stats(adapter)
+                logger.info("{} requests over {} connections ({} reused)".format(
+                    n_requests, n_connections, n_requests - n_connections))
+
+        if self.engine == 'async':
+            fetcher.close()
+        else:
+            session.close()
+            session.executor.shutdown(wait=True)
+        logger.info("Process #{} terminated.".format(process_id))
+
+    def _fetch_threaded(self, session, urls, limit):
+        """
+        Downloads urls with a FuturesSession, keeping at most int(limit)
+        requests in flight. Yields (url, status_code, html, seconds) for each
+        url as it completes; status_code and html are None if the request
+        failed.
+        """
+        urls = deque(urls)
+        pending = {} # future -> (url, start time)
+        while urls or pending:
+            # limit may have changed while the caller handled a page
+            while urls and len(pending) < int(limit):
+                url = urls.popleft()
+                pending[session.get(url)] = (url, time())
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, start = pending.pop(future)
+                try:
+                    response = future.result()
+                except requests.exceptions.ConnectionError as e:
+                    logging.error(str(e))
+                    yield url, None, None, time() - start
+                    continue
+                yield url, response.status_code, response.text, \
+                    response.elapsed.total_seconds()
 
-                logger.info("Got {} dialogs from {}, {} are valid."\
-                    .format(len(dialogs), author, n_valid, process_id))
+    def save_bloom(self, force=False):
+        """
+        Saves the Bloom filter to self.bloom_path if the last snapshot is older
+        than self.bloom_interval seconds.
+        """
+        if not self.bloom_path:
+            return
+        with self.bloom_saved.get_lock():
+            if not force and time() - self.bloom_saved.value < self.bloom_interval:
+                return
+            self.bloom_saved.value = time()
+        self.bloom.save(self.bloom_path)
+        logging.info("Saved {} dialog ids to {}".format(len(self.bloom),
+            self.bloom_path))
+
+    def start_reader(self, auth, track, languages):
+        """
+        Reads the stream in a dedicated process, which does nothing but
+        filter statuses and put the authors of replies in self.ring. Call
+        feed() to move them on to the workers.
+        """
+        self.reader = mp.Process(target=self._read_stream,
+            args=(auth, track, languages), daemon=True)
+        self.reader.start()
 
-            self.write_dialogs(results)
+    def _read_stream(self, auth, track, languages):
+        self.reading = True
+        self.start_profiler('stream')
+        try:
+            while not self.flag_stop_reading.value:
+                stream = tweepy.Stream(auth=auth, listener=self)
+                try:
+                    stream.filter(track=track, languages=languages,
+                        stall_warnings=True)
+                except Exception:
+                    logging.info("The Stream got interrupted.")
+                    traceback.print_exc()
+                stream.disconnect()
+                if self.flag_stop_reading.value:
+                    break
+                self.metrics.count('stream_disconnects')
+                self.metrics.flush()
+                logging.info("A new instance of the Stream will be created.")
+        finally:
+            self.stop_profiler()
+            self.metrics.flush()
+
+    def feed(self):
+        """
+        Moves the authors read by the reader process on to the workers,
+        until the reader terminates.
+        """
+        while self.reader.is_alive():
+            if not self.ring.wait(timeout=1):
+                continue # see whether the reader is still alive
+            records = self.ring.get()
+
+            now = time()
+            for screen_name, tweet_id, created, received in records:
+                # how far the stream is behind twitter, and we behind it
+                if created:
+                    self.metrics.observe('stream_lag', received - created)
+                self.metrics.observe('ring_lag', now - received)
+                self.enqueue_tweet(screen_name, tweet_id)
+            self.metrics.gauge('ring_depth', len(self.ring))
+            if self.profiler:
+                self.profiler.maybe_dump()
+        logging.error("The stream reader terminated.")
+
+    def stop_reader(self):
+        if self.reader is None:
+            return
+        self.flag_stop_reading.value = True # seen at the next status
+        self.reader.join(timeout=5)
+        if self.reader.is_alive():
+            self.reader.terminate()
+        self.reader = None
 
-        logger.info("Process #{} terminated.".format(process_id))
+    def close(self, drain=False):
+        """
+        Tells the worker processes to terminate and waits for them. With
+        drain, the workers first consume the batches already queued.
+        """
+        self.stop_reader()
+        if drain:
+            for _ in self.processes:
+                self.batch_pool.put(None) # queued behind the last batch
+        else:
+            self.flag_terminate.value = True
+        # wake up workers blocked on an empty queue
+        for _ in self.processes:
+            try:
+                self.batch_pool.put_nowait(None)
+            except queue.Full:
+                pass # workers will see flag_terminate after poll_interval
+        for process in self.processes:
+            process.join()
+        self.writer.close()
+        self.save_bloom(force=True)
+        self.save_author_cache()
 
 
     def clean_message(self, message):
         return re.sub('[\r\n]', ' ', message)
 
     def on_warning(self, notice):
+        # stall warnings mean we're falling behind the stream
+        if notice.get('code') == 'FALLING_BEHIND':
+            self.n_stall_warnings += 1
+            self.metrics.count('stall_warnings')
         logging.info("A warning arrived: {}".format(notice))
 
+    def on_limit(self, track):
+        # track is the number of matching tweets not delivered so far
+        self.metrics.gauge('undelivered_statuses', track)
+
     def on_event(self, status):
         logging.info("An event arrived: {}".format(status))
 
@@ -210,22 +575,98 @@ class StreamListener(tweepy.StreamListener):
         # logging.error("All processes were terminated. Raising exception...")
         raise exc
 
+    def on_data(self, raw_data):
+        """
+        Reads statuses straight from the JSON, instead of letting tweepy
+        build a Status for each of them, most of which are discarded.
+        """
+        if self.flag_stop_reading.value:
+            return False # disconnects
+        data = json.loads(raw_data)
+        if 'in_reply_to_status_id' not in data:
+            # deletes, limits, warnings, etc.: let tweepy dispatch them
+            return super().on_data(raw_data)
+        created = data.get('timestamp_ms')
+        self.filter_status(data.get('lang'), data['in_reply_to_status_id'],
+            data['user']['screen_name'], data['id_str'],
+            int(created) / 1000 if created else None)
+
     def on_status(self, tweet):
-        if tweet.lang != 'en':
+        self.filter_status(tweet.lang, tweet.in_reply_to_status_id,
+            tweet.user.screen_name, tweet.id_str)
+
+    def filter_status(self, lang, in_reply_to_status_id, screen_name, tweet_id,
+        created=None):
+        if self.profiler:
+            self.profiler.maybe_dump()
+        self.n_statuses += 1
+        self.metrics.count('statuses_received')
+        now = time()
+        if now - self.reported_at >= self.report_interval:
+            self.report_stream_rates()
+        if self.reading and now - self.metrics_flushed_at >= 1:
+            self.metrics.flush() # the reader is not the metrics owner
+            self.metrics_flushed_at = now
+
+        if lang != 'en':
+            self.metrics.count('statuses_filtered_lang')
             return
 
         # get only the tweets that are part of a convo
-        if tweet.in_reply_to_status_id is None:
+        if in_reply_to_status_id is None:
+            self.metrics.count('statuses_filtered_not_reply')
             return
 
-        self.enqueue_tweet(tweet)
+        if not self.reading:
+            self.enqueue_tweet(screen_name, tweet_id)
+        elif not self.ring.put(screen_name, tweet_id, created, now):
+            self.metrics.count('ring_overflows') # feed() fell behind
+
+    def report_stream_rates(self):
+        now = time()
+        elapsed = now - self.reported_at
+        n_statuses = self.n_statuses - self.reported_counts[0]
+        n_warnings = self.n_stall_warnings - self.reported_counts[1]
+        self.metrics.gauge('statuses_per_sec', n_statuses / elapsed)
+        self.metrics.gauge('stall_warnings_per_min', n_warnings * 60 / elapsed)
+        logging.info("Stream: {:.1f} statuses/s, {} stall warnings in {:.0f}s."
+            .format(n_statuses / elapsed, n_warnings, elapsed))
+        self.reported_at = now
+        self.reported_counts = (self.n_statuses, self.n_stall_warnings)
 
     def on_error(self, status_code):
+        self.metrics.count('stream_errors_{}'.format(status_code))
         logging.error("An error was caught (Status {})".format(status_code))
         # if status_code == 420:
         #     return False
 
 
+def get_futures_session(max_threads):
+    """
+    Returns a FuturesSession backed by max_threads threads and its HTTPS
+    adapter. The adapter keeps up to max_threads connections alive per host.
+    """
+    session = FuturesSession(
+        executor=ThreadPoolExecutor(max_workers=max_threads))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_threads)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter) # a local stand-in of twitter.com
+    return session, adapter
+
+
+def connection_stats(adapter):
+    """
+    Returns the number of requests served and connections opened by all
+    the connection pools of a requests adapter.
+    """
+    n_requests = n_connections = 0
+    for key in adapter.poolmanager.pools.keys():
+        pool = adapter.poolmanager.pools[key]
+        n_requests += pool.num_requests
+        n_connections += pool.num_connections
+    return n_requests, n_connections
+
+
 def get_auth(config_path):
     config = ConfigParser()
     config.read(config_path)
@@ -243,27 +684,33 @@ def get_auth(config_path):
 
 
 def main(outfile_path, config_path, max_threads, max_processes,
-    min_length, max_length, num_speakers):
+    min_length, max_length, num_speakers, **kwargs):
     # listen to the stream for english tweets
     # then find author and look for conversations in their timelines
 
     listener = StreamListener(outfile_path, config_path, max_threads,
-                max_processes, min_length, max_length, num_speakers)
+                max_processes, min_length, max_length, num_speakers, **kwargs)
 
-    while True:    
-        try:
-            myStream = tweepy.Stream(auth=get_auth(config_path),
-                listener=listener)
-            myStream.filter(track=top100_english, languages=['en'],
-                stall_warnings=True)
-        except Exception as e:
-            logging.info("The Stream got interrupted.")
-            myStream.disconnect()
-            traceback.print_exc()
-            logging.info("A new instance of the Stream will be created.")
+    # the stream is read in a process of its own, so nothing done here
+    # (batching, author cache, feeding the workers) can make it fall behind
+    listener.start_reader(get_auth(config_path), top100_english, ['en'])
+    listener.start_profiler('feeder')
+
+    try:
+        listener.feed()
+    finally:
+        listener.stop_profiler()
+        listener.close()
 
 
 
+def positive_int(value):
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError("must be at least 1: " + value)
+    return n
+
+
 def options():
     parser = argparse.ArgumentParser()
     parser.add_argument('outfile')
@@ -278,6 +725,53 @@ def options():
         help="the maximum length of a conversation")
     parser.add_argument('--num_speakers', type=int, default=None,
         help="desired number of speakers (e.g. 2)")
+    parser.add_argument('--engine', choices=['threads', 'async'],
+        default='threads',
+        help="how pages are downloaded: a thread pool per process, or "
+             "a single asyncio event loop per process (requires aiohttp)")
+    parser.add_argument('--max_concurrency', type=int, default=200,
+        help="max. # of concurrent page downloads per process (async engine)")
+    parser.add_argument('--timeout', type=float, default=10,
+        help="seconds before a page download is abandoned (async engine)")
+    parser.add_argument('--parser', choices=['bs4', 'lxml'], default='bs4',
+        help="how conversation pages are parsed: BeautifulSoup or plain lxml")
+    parser.add_argument('--bloom_filter', default=None,
+        help="file where the ids of collected dialogs are saved, "
+             "so duplicates are skipped across runs")
+    parser.add_argument('--bloom_capacity', type=int, default=10000000,
+        help="the number of dialogs the Bloom filter is sized for")
+    parser.add_argument('--bloom_error_rate', type=float, default=0.001,
+        help="the Bloom filter's false-positive rate at full capacity")
+    parser.add_argument('--author_cache', default=None,
+        help="file where recently scanned authors are saved across runs")
+    parser.add_argument('--author_ttl', type=int, default=21600,
+        help="seconds before an author's timeline can be scanned again "
+             "(0 disables the author cache)")
+    parser.add_argument('--author_cache_size', type=int, default=100000,
+        help="max. # of recently scanned authors to remember")
+    parser.add_argument('--metrics_port', type=int, default=None,
+        help="serve the counters and latency histograms as JSON on this port")
+    parser.add_argument('--metrics_file', default=None,
+        help="file where the counters and latency histograms are saved")
+    parser.add_argument('--metrics_interval', type=int, default=60,
+        help="seconds between snapshots of --metrics_file")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'],
+        default=None,
+        help="profile the workers and the stream thread, with cProfile "
+             "(every call) or by sampling their stacks (less overhead)")
+    parser.add_argument('--profile_dir', default='profiles',
+        help="where the profiles are saved (see profile_report.py)")
+    parser.add_argument('--profile_interval', type=int, default=300,
+        help="seconds between profile dumps")
+    parser.add_argument('--adaptive', action='store_true',
+        help="adapt the concurrent downloads of each process to errors and "
+             "latency, up to --max_threads (or --max_concurrency)")
+    parser.add_argument('--min_concurrency', type=positive_int, default=1,
+        help="the fewest concurrent downloads per process with --adaptive")
+    parser.add_argument('--twitter_url', default=scraping.TWITTER_URL,
+        help="where conversation pages are downloaded from")
+    parser.add_argument('--api_url', default=scraping.API_URL,
+        help="where timelines are requested from")
     return parser.parse_args()
 
 
@@ -287,5 +781,19 @@ if __name__ == '__main__':
     if not opts.max_processes:
         opts.max_processes = max([mp.cpu_count() - 1, 1])
 
+    # set before the workers are forked, so they inherit them
+    scraping.TWITTER_URL = opts.twitter_url
+    scraping.API_URL = opts.api_url
+
     main(opts.outfile, opts.config, opts.max_threads, opts.max_processes,
-        opts.min_length, opts.max_length, opts.num_speakers)
+        opts.min_length, opts.max_length, opts.num_speakers,
+        engine=opts.engine, max_concurrency=opts.max_concurrency,
+        timeout=opts.timeout, parser=opts.parser, bloom_path=opts.bloom_filter,
+        bloom_capacity=opts.bloom_capacity,
+        bloom_error_rate=opts.bloom_error_rate,
+        author_cache_path=opts.author_cache, author_ttl=opts.author_ttl,
+        author_cache_size=opts.author_cache_size,
+        metrics_port=opts.metrics_port, metrics_path=opts.metrics_file,
+        metrics_interval=opts.metrics_interval, profile=opts.profile,
+        profile_dir=opts.profile_dir, profile_interval=opts.profile_interval,
+        adaptive=opts.adaptive, min_concurrency=opts.min_concurrency)
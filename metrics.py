@@ -0,0 +1,189 @@
+import bisect
+import json
+import logging
+import multiprocessing as mp
+import os
+import random
+import threading
+
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time, sleep
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets (in seconds), plus a bounded random
+    sample of the observations to estimate percentiles.
+    """
+
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+        30, 60)
+    max_samples = 10000
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1) # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.samples = []
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        # reservoir sampling keeps every observation equally likely
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            i = random.randrange(self.count)
+            if i < self.max_samples:
+                self.samples[i] = seconds
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(int(p / 100 * len(samples)), len(samples) - 1)]
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'],
+                self.counts)),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class Metrics:
+    """
+    Counters and latency histograms shared by the processes of getdialogs.
+    Create it before forking: observations made in other processes are
+    buffered and sent to the creating process on flush(), where a thread
+    aggregates them.
+    """
+
+    def __init__(self):
+        self.owner_pid = os.getpid()
+        self.queue = mp.Queue()
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.histograms = defaultdict(Histogram)
+        self.gauges = {}
+        self.buffer = [] # observations not sent yet (other processes only)
+        self.start_time = time()
+
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def _record(self, kind, name, value):
+        if os.getpid() != self.owner_pid:
+            self.buffer.append((kind, name, value))
+            return
+        with self.lock:
+            self._apply(kind, name, value)
+
+    def _apply(self, kind, name, value):
+        if kind == 'count':
+            self.counters[name] += value
+        elif kind == 'observe':
+            self.histograms[name].observe(value)
+        else:
+            self.gauges[name] = value
+
+    def count(self, name, n=1):
+        self._record('count', name, n)
+
+    def observe(self, name, seconds):
+        self._record('observe', name, seconds)
+
+    def gauge(self, name, value):
+        self._record('gauge', name, value)
+
+    def timer(self, name):
+        """
+        Context manager that observes the time spent in its block.
+        """
+        return _Timer(self, name)
+
+    def flush(self):
+        """
+        Sends the observations buffered in this process to the owner.
+        """
+        if self.buffer:
+            self.queue.put(self.buffer)
+            self.buffer = []
+
+    def _collect(self):
+        while True:
+            observations = self.queue.get()
+            with self.lock:
+                for kind, name, value in observations:
+                    self._apply(kind, name, value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'uptime': time() - self.start_time,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': dict((name, h.snapshot())
+                    for name, h in self.histograms.items()),
+            }
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def save_every(self, path, interval=60):
+        """
+        Saves a snapshot to path every interval seconds, from a thread.
+        """
+        def run():
+            while True:
+                sleep(interval)
+                try:
+                    self.save(path)
+                except OSError as e:
+                    logging.error("Unable to save metrics: {}".format(e))
+        threading.Thread(target=run, daemon=True).start()
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves the snapshot as JSON on http://host:port/, from a thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(metrics.snapshot(), indent=2).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time() - self.start)
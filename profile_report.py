@@ -0,0 +1,55 @@
+"""Merges the profiles dumped by getdialogs.py --profile into one report of
+the hot functions across all processes.
+
+Usage: python profile_report.py [--sort cumulative|tottime|ncalls]
+                                [--limit N] [--output merged.prof]
+                                profiles/*.prof
+
+Functions are ranked by the time summed over all the files. --output saves
+the merged stats, e.g. for snakeviz. Profiles of the workers
+(worker-<pid>.prof), of the stream reader (stream-<pid>.prof) and of the
+process feeding the workers (feeder-<pid>.prof) can be merged separately
+to compare them.
+"""
+
+import argparse
+import os
+import pstats
+import sys
+
+
+def main(args):
+    paths = [path for path in args.profiles if os.path.getsize(path) > 0]
+    if not paths:
+        sys.exit("no profiles to merge")
+
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+
+    if args.output:
+        stats.dump_stats(args.output) # before strip_dirs merges names
+        print('Merged stats saved to {}'.format(args.output))
+
+    print('Merged {} profiles ({:.1f}s in total):'.format(len(paths),
+        stats.total_tt))
+    for path in paths:
+        print('  ' + path)
+    print()
+    stats.strip_dirs().sort_stats(args.sort).print_stats(args.limit)
+    if args.callers:
+        stats.print_callers(args.limit)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('profiles', nargs='+', help="files dumped by --profile")
+    parser.add_argument('--sort', default='cumulative',
+        choices=['cumulative', 'tottime', 'ncalls'],
+        help="how functions are ranked")
+    parser.add_argument('--limit', type=int, default=40,
+        help="the number of functions in the report")
+    parser.add_argument('--callers', action='store_true',
+        help="also show who calls the top functions")
+    parser.add_argument('--output', help="save the merged stats to this file")
+    main(parser.parse_args())
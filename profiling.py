@@ -0,0 +1,123 @@
+import cProfile
+import logging
+import marshal
+import os
+import sys
+import threading
+
+from collections import Counter, defaultdict
+from time import time, sleep
+
+
+class Profiler:
+    """
+    Profiles the thread that calls start(), and dumps the stats to
+    <directory>/<name>-<pid>.prof every interval seconds and on stop().
+
+    mode is either 'cprofile', which records every call (exact, but slows
+    the thread down), or 'sample', which looks at the thread's stack every
+    sample_interval seconds from another thread. Both dump files in the
+    pstats format, so they can be merged with profile_report.py.
+    """
+
+    def __init__(self, directory, name, mode='cprofile', interval=300,
+        sample_interval=0.005):
+        self.path = os.path.join(directory, '{}-{}.prof'.format(name,
+            os.getpid()))
+        self.mode = mode
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.last_dump = time()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = Sampler(threading.get_ident(), self.sample_interval)
+            self.profiler.start()
+
+    def maybe_dump(self):
+        """
+        Dumps the stats if the last dump is older than interval seconds.
+        Call it from the profiled thread.
+        """
+        if time() - self.last_dump >= self.interval:
+            self.dump()
+
+    def dump(self, restart=True):
+        self.last_dump = time()
+        self.profiler.dump_stats(self.path) # cProfile stops profiling here
+        if restart and self.mode == 'cprofile':
+            self.profiler.enable()
+        logging.info("Saved profile to {}".format(self.path))
+
+    def stop(self):
+        if self.mode == 'sample':
+            self.profiler.stop()
+        self.dump(restart=False)
+
+
+class Sampler:
+    """
+    A sampling profiler of one thread. Each sample charges the time since
+    the previous sample to the function at the top of the stack (its own
+    time) and to every function on the stack (its cumulative time).
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.own = Counter()
+        self.cumulative = Counter()
+        self.callers = defaultdict(Counter) # callee -> caller -> samples
+        self.lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def _run(self):
+        last = time()
+        while self.running:
+            sleep(self.interval)
+            now = time()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue # the thread is gone
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno,
+                    code.co_name))
+                frame = frame.f_back
+            with self.lock:
+                self.own[stack[0]] += elapsed
+                for function in set(stack): # count recursion once
+                    self.samples[function] += 1
+                    self.cumulative[function] += elapsed
+                for callee, caller in zip(stack, stack[1:]):
+                    self.callers[callee][caller] += 1
+
+    def dump_stats(self, path):
+        """
+        Saves the samples in the format of pstats. Call counts are the
+        number of samples a function appeared in.
+        """
+        with self.lock:
+            stats = {}
+            for function, n in self.samples.items():
+                callers = dict(self.callers.get(function, {}))
+                stats[function] = (n, n, self.own[function],
+                    self.cumulative[function], callers)
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
@@ -0,0 +1,93 @@
+"""Records a fixture directory for bench_replay.py from the synthetic users of
+twitter_standin.py, so the benchmark can be run and reproduced offline.
+
+Usage: python record_fixtures.py [--authors 200] [--timeline_size 200]
+                                 [--max_turns 8] [--seed 0]
+                                 [--start 1514764800] fixtures/
+
+It writes the layout bench_replay.py reads:
+  statuses.jsonl              the latest tweets of each author, as the
+                              streaming API delivers them, oldest first
+  timelines/<screen_name>.json  the statuses/user_timeline response of each
+                              author, newest first
+  pages/<tweet id>.html       the conversation page of every reply in the
+                              timelines
+
+Some statuses aren't replies, so the filter of the listener is exercised too.
+The same options always give the same tweets, dated from --start on. Existing
+files of the directory are overwritten, others are left in place, e.g. pages
+saved from twitter.com.
+"""
+
+import argparse
+import calendar
+import json
+import os
+
+from email.utils import parsedate
+
+from twitter_standin import World, render_page
+
+
+def stream_status(tweet):
+    # the streaming API adds the time of the tweet in milliseconds
+    status = dict(tweet)
+    status['timestamp_ms'] = str(
+        calendar.timegm(parsedate(tweet['created_at'])) * 1000)
+    return status
+
+
+def record(directory, world, n_authors, statuses_per_author=2):
+    """
+    Writes the fixtures of the first n_authors users of world. Returns the
+    number of statuses, timelines and pages written.
+    """
+    for subdirectory in ['timelines', 'pages']:
+        os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+
+    statuses = []
+    pages = set()
+    for i in range(n_authors):
+        screen_name = world.screen_name(i)
+        timeline = [world.get(tid) for tid in world.timeline(screen_name)]
+        with open(os.path.join(directory, 'timelines', screen_name + '.json'),
+            'w', encoding='utf-8') as f:
+            json.dump(timeline, f)
+        statuses.extend(timeline[:statuses_per_author])
+        pages.update(t['id'] for t in timeline
+                     if t['in_reply_to_status_id'] is not None)
+
+    for tweet_id in pages:
+        with open(os.path.join(directory, 'pages', '{}.html'.format(tweet_id)),
+            'w', encoding='utf-8') as f:
+            f.write(render_page(world.conversation(tweet_id)))
+
+    statuses.sort(key=lambda t: t['id'])
+    with open(os.path.join(directory, 'statuses.jsonl'), 'w',
+        encoding='utf-8') as f:
+        for tweet in statuses:
+            f.write(json.dumps(stream_status(tweet)) + '\n')
+    return len(statuses), n_authors, len(pages)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help="where the fixtures are written")
+    parser.add_argument('--authors', type=int, default=200,
+        help="the number of authors in the stream")
+    parser.add_argument('--timeline_size', type=int, default=200,
+        help="the number of tweets in each timeline")
+    parser.add_argument('--max_turns', type=int, default=8,
+        help="the maximum length of a conversation")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', type=int, default=1514764800,
+        help="time of the first tweets, in seconds since the epoch")
+    args = parser.parse_args()
+
+    world = World(n_users=max(args.authors, 1000),
+        timeline_size=args.timeline_size, max_turns=args.max_turns,
+        seed=args.seed, start=args.start)
+    n_statuses, n_timelines, n_pages = record(args.directory, world,
+        args.authors)
+    print('{} statuses, {} timelines and {} pages written to {}'.format(
+        n_statuses, n_timelines, n_pages, args.directory))
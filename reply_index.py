@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""reply_index.py:
+   Rebuild dialogs from tweets by following in_reply_to_status_id.
+
+"""
+
+
+class ReplyIndex(object):
+    '''
+      Index of tweets by id. Each tweet points to its source tweet through
+      'in_reply_to_status_id', so a dialog is the chain of sources of its
+      terminal tweet
+    '''
+    def __init__(self, tweets=()):
+        self.tweets = {}
+        self.add(tweets)
+
+    def __contains__(self, tid):
+        return tid in self.tweets
+
+    def add(self, tweets):
+        '''
+        add tweets to the index and return the ids of their source tweets
+        that are not in the index yet
+        '''
+        # a single pass, so tweets can be a generator; a source may come
+        # later in tweets than its reply, hence the check at the end
+        reply_ids = set()
+        for tweet in tweets:
+            self.tweets[tweet['id']] = tweet
+            reply_id = tweet['in_reply_to_status_id']
+            if reply_id is not None:
+                reply_ids.add(reply_id)
+        return set(tid for tid in reply_ids if tid not in self.tweets)
+
+    def chain(self, tid):
+        '''
+        the dialog ending in tweet tid, from its first known source tweet
+        '''
+        dialog = []
+        tweet = self.tweets.get(tid)
+        while tweet is not None:
+            dialog.append(tweet)
+            reply_id = tweet['in_reply_to_status_id']
+            if reply_id is None:
+                break
+            tweet = self.tweets.get(reply_id)
+        dialog.reverse()
+        return dialog
+
+    def dialogs(self, terminals):
+        '''
+        yield (terminal id, dialog) for each terminal tweet, in order,
+        skipping terminals that are a source tweet of a previous dialog.
+        Dialogs with a single tweet are yielded too
+        '''
+        visited = set()
+        for tweet in terminals:
+            tid = tweet['id']
+            if tid in visited: # it's not a terminal
+                continue
+            dialog = self.chain(tid)
+            for source in dialog:
+                visited.add(source['id'])
+            # the source of the first tweet is unknown, but it's visited too
+            reply_id = dialog[0]['in_reply_to_status_id']
+            if reply_id is not None:
+                visited.add(reply_id)
+            yield tid, dialog
@@ -0,0 +1,76 @@
+import multiprocessing as mp
+import struct
+
+
+class RingBuffer:
+    """
+    A fixed-size queue of author records in shared memory, with one
+    producer and one consumer process (forked after its creation). The
+    producer never blocks: when the buffer is full, put() drops the record
+    and returns False.
+
+    The lock only guards the head and tail counters, so neither side waits
+    for the other while packing or unpacking records. Taking it also makes
+    the record written before a head update visible to the consumer.
+
+    The consumer sleeps in wait() until the producer puts a record into
+    the empty buffer, which releases a semaphore once, not per record.
+    """
+
+    # time received, time created (0 if unknown), tweet id, screen name
+    record = struct.Struct('<ddQ16s')
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.buffer = mp.RawArray('c', capacity * self.record.size)
+        self.head = mp.RawValue('Q', 0) # records written so far
+        self.tail = mp.RawValue('Q', 0) # records read so far
+        self.lock = mp.Lock()
+        self.not_empty = mp.Semaphore(0)
+
+    def __len__(self):
+        with self.lock:
+            return self.head.value - self.tail.value
+
+    def put(self, screen_name, tweet_id, created, received):
+        with self.lock:
+            head, tail = self.head.value, self.tail.value
+        if head - tail >= self.capacity:
+            return False
+        # screen names have at most 15 ASCII characters
+        self.record.pack_into(self.buffer,
+            (head % self.capacity) * self.record.size, received,
+            created or 0.0, int(tweet_id), screen_name.encode('utf-8')[:16])
+        with self.lock:
+            self.head.value = head + 1
+            was_empty = self.tail.value == head
+        if was_empty:
+            self.not_empty.release()
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the buffer holds a record or timeout seconds pass.
+        Returns False on timeout.
+        """
+        while len(self) == 0:
+            if not self.not_empty.acquire(timeout=timeout):
+                return False
+        return True
+
+    def get(self, max_records=1000):
+        """
+        Returns up to max_records (screen_name, tweet_id, created, received)
+        tuples, oldest first. created is None if unknown.
+        """
+        with self.lock:
+            head, tail = self.head.value, self.tail.value
+        records = []
+        for i in range(tail, min(head, tail + max_records)):
+            received, created, tweet_id, screen_name = self.record.unpack_from(
+                self.buffer, (i % self.capacity) * self.record.size)
+            records.append((screen_name.rstrip(b'\0').decode('utf-8'),
+                str(tweet_id), created or None, received))
+        with self.lock:
+            self.tail.value = tail + len(records)
+        return records
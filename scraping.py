@@ -1,19 +1,59 @@
 
 from bs4 import BeautifulSoup
+import lxml.etree
+import lxml.html
 import requests
 import logging
 
 
+# where pages and API requests go; can point to a local stand-in for testing
+TWITTER_URL = 'https://twitter.com'
+API_URL = 'https://api.twitter.com/1.1'
+
+# XPath equivalents of BeautifulSoup's class matching, e.g. find_all('div', 'tweet')
+def _has_class(name):
+    return 'contains(concat(" ", normalize-space(@class), " "), " {} ")'\
+        .format(name)
+
+_overlay_tweets = lxml.etree.XPath(
+    '//div[@id="permalink-overlay"]//div[{}]'.format(_has_class('tweet')))
+_tweet_text = lxml.etree.XPath(
+    './/p[{}]'.format(_has_class('js-tweet-text')))
+
+
+# canonical copies of the strings that repeat across tweets. Unlike
+# sys.intern, the table is bounded, so a long-running worker doesn't keep
+# every user name it ever saw
+_strings = {}
+_max_strings = 100000
+
+def _intern(value):
+    if not isinstance(value, str):
+        return value
+    canonical = _strings.get(value)
+    if canonical is None:
+        if len(_strings) >= _max_strings:
+            _strings.clear()
+        canonical = _strings[value] = str(value) # drop str subclasses
+    return canonical
+
+
 class Tweet:
     """
     A tweet that belongs to a conversation.
+
+    Workers hold many of these at a time, so they have no __dict__, and
+    the strings that repeat across tweets (user names and conversation ids)
+    are deduplicated, so all tweets share a single copy of each.
     """
 
+    __slots__ = ('user', 'id', 'convo_id', 'fullname', 'text')
+
     def __init__(self, user, tweet_id, fullname, text, convo_id=None):
-        self.user = user
+        self.user = _intern(user)
         self.id = tweet_id
-        self.convo_id = convo_id
-        self.fullname = fullname
+        self.convo_id = _intern(convo_id)
+        self.fullname = _intern(fullname)
         self.text = text
 
     def is_reply(self):
@@ -30,7 +70,46 @@ class Tweet:
         )
 
     @classmethod
-    def from_conversation(cls, html):
+    def from_element(cls, tweet):
+        text = _tweet_text(tweet)
+        if not text:
+            raise AttributeError("tweet has no text")
+        return cls(
+            user=tweet.attrib['data-screen-name'],
+            tweet_id=tweet.attrib['data-tweet-id'],
+            convo_id=tweet.attrib['data-conversation-id'],
+            fullname=tweet.attrib['data-name'],
+            # a plain str: lxml's smart strings keep the whole page alive
+            text=str(text[0].text_content() or "")
+        )
+
+    @classmethod
+    def from_conversation(cls, html, parser='bs4'):
+        """
+        Yields the tweets of a conversation page. parser is either 'bs4',
+        which builds a BeautifulSoup tree, or 'lxml', which queries the
+        lxml tree directly with XPath and skips building the soup.
+        """
+        if parser == 'lxml':
+            return cls._from_conversation_lxml(html)
+        return cls._from_conversation_bs4(html)
+
+    @classmethod
+    def _from_conversation_lxml(cls, html):
+        try:
+            root = lxml.html.fromstring(html)
+        except lxml.etree.ParserError: # empty document
+            return
+        for tweet in _overlay_tweets(root):
+            try:
+                yield cls.from_element(tweet)
+            except AttributeError:
+                pass  # Incomplete info? Discard!
+            except KeyError:
+                pass
+
+    @classmethod
+    def _from_conversation_bs4(cls, html):
         soup = BeautifulSoup(html, "lxml")
         overlay = soup.find('div', id='permalink-overlay')
         if overlay:
@@ -112,7 +191,7 @@ class Tweet:
             'screen_name': username,
             'count':max_count
             }
-        url = 'https://api.twitter.com/1.1/statuses/user_timeline.json'
+        url = API_URL + '/statuses/user_timeline.json'
 
         try:
             response = requests.get(url, params=params, headers=headers)
@@ -135,12 +214,27 @@ class Tweet:
 
             yield cls(
                         user=tweet_json['user']['screen_name'],
-                        tweet_id=tweet_json['conversation_id'],
-                        convo_id=tweet_json['id'],
+                        tweet_id=tweet_json['id'],
+                        convo_id=tweet_json.get('conversation_id',
+                                                tweet_json['id']),
                         fullname=tweet_json['user']['name'],
                         text=tweet_json['text']
                     )
 
+    @staticmethod
+    def latest_per_conversation(tweets):
+        """
+        Returns the most recent tweet of each conversation in tweets. Its
+        page holds the whole thread up to that point, so it's the only one
+        worth downloading.
+        """
+        latest = {}
+        for tweet in tweets:
+            other = latest.get(tweet.convo_id)
+            if other is None or int(tweet.id) > int(other.id):
+                latest[tweet.convo_id] = tweet
+        return list(latest.values())
+
     @classmethod
     def from_url(cls, url):
         html = requests.get(url).text
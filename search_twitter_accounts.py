@@ -15,29 +15,20 @@ import json
 import sys
 import os
 import logging
-from requests_oauthlib import OAuth1Session
+import twitter_api
+from credentials import get_session_pool
 from twitter_api import GETUsersSearch
-
-try:
-    from configparser import ConfigParser
-except ImportError:
-    from ConfigParser import SafeConfigParser as ConfigParser
+from twitter_api import RetryPolicy
 
 # create logger object
 logger = logging.getLogger("root")
 logger.setLevel(logging.INFO)
 
 def Main(args):
-    # get access keys from a config file
-    config = ConfigParser()
-    config.read(args.config)
-    ConsumerKey = config.get('AccessKeys','ConsumerKey')
-    ConsumerSecret = config.get('AccessKeys','ConsumerSecret')
-    AccessToken = config.get('AccessKeys','AccessToken')
-    AccessTokenSecret = config.get('AccessKeys','AccessTokenSecret')
+    twitter_api.REST_API_URL = args.api_url
 
-    # open a session 
-    session = OAuth1Session(ConsumerKey, ConsumerSecret, AccessToken, AccessTokenSecret)
+    # open a session for each set of access keys in the config files
+    session = get_session_pool(args.config or ['config.ini'])
 
     # collect users from the queries
     user_search = GETUsersSearch(session)
@@ -45,6 +36,7 @@ def Main(args):
     user_search.waitReady()
     result = user_search.call()
     logger.info('obtained %d users' % len(result))
+    RetryPolicy.of(session).report()
 
     if args.dump:
         logger.info('writing raw data to file %s' % args.dump)
@@ -63,12 +55,15 @@ def Main(args):
 if __name__ =="__main__":
     # parse command line
     parser = argparse.ArgumentParser()
-    parser.add_argument('-c', '--config', default='config.ini', help="config file")
+    parser.add_argument('-c', '--config', action='append',
+                        help="config file (can be repeated to use several credentials)")
     parser.add_argument('-o', '--output', help="output screen names to a file")
     parser.add_argument('-D', '--dump', help="dump raw data to a file")
     parser.add_argument('-l', '--logfile', help="set a log file")
     parser.add_argument('-n', '--count', default=100, type=int, 
                         help="maximum number of tweets acquired from each account")
+    parser.add_argument('--api_url', default=twitter_api.REST_API_URL,
+                        help="base URL of the REST API (e.g. a local stand-in)")
     parser.add_argument('-d', '--debug', action='store_true', help="debug mode")
     parser.add_argument('queries', metavar='KW', nargs='+', help='query keywords')
     args = parser.parse_args()
@@ -0,0 +1,38 @@
+import argparse
+
+import pytest
+
+from adaptive_limit import AdaptiveLimit
+
+
+def test_errors_halve_the_limit_once_per_round():
+    limit = AdaptiveLimit(16, minimum=1, maximum=16)
+    assert limit.record(503, 0.1) == 'decrease'
+    assert int(limit) == 8
+    assert limit.record(503, 0.1) is None # same round
+    for _ in range(8):
+        limit.record(200, 0.1)
+    assert limit.record(None, 0.1) == 'decrease'
+
+
+def test_404s_are_healthy():
+    limit = AdaptiveLimit(4, minimum=1, maximum=8)
+    for _ in range(20):
+        limit.record(404, 0.1)
+    assert int(limit) > 4
+
+
+@pytest.mark.parametrize('minimum', [0, -3])
+def test_limit_never_drops_below_one(minimum):
+    limit = AdaptiveLimit(8, minimum=minimum, maximum=8)
+    for _ in range(1000):
+        limit.record(503, 0.1)
+    assert int(limit) == 1
+    assert limit.at_minimum()
+
+
+def test_min_concurrency_must_be_positive():
+    getdialogs = pytest.importorskip('getdialogs')
+    assert getdialogs.positive_int('2') == 2
+    with pytest.raises(argparse.ArgumentTypeError):
+        getdialogs.positive_int('0')
@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import socket
+
+import pytest
+
+from conftest import FIXTURES, ROOT
+
+pytest.importorskip('tweepy')
+pytest.importorskip('requests_futures')
+
+import bench_replay
+import scraping
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_replay_smoke(tmp_path, monkeypatch):
+    # main() points the scrapers at the fixture server
+    monkeypatch.setattr(scraping, 'TWITTER_URL', scraping.TWITTER_URL)
+    monkeypatch.setattr(scraping, 'API_URL', scraping.API_URL)
+    output = str(tmp_path / 'bench_replay.json')
+    args = argparse.Namespace(fixtures=FIXTURES, processes=[1], threads=[2],
+        engine='threads', parser='lxml', min_length=2, max_length=999,
+        config=os.path.join(ROOT, 'config.ini'), port=free_port(),
+        output=output)
+    bench_replay.main(args)
+
+    with open(output) as f:
+        runs = json.load(f)['runs']
+    assert len(runs) == 1
+    run = runs[0]
+    statuses = [json.loads(line)
+                for line in bench_replay.load_statuses(FIXTURES)]
+    assert run['statuses'] == len(statuses)
+    # every reply is scanned, including the last, partial batch
+    replies = [s for s in statuses if s['in_reply_to_status_id'] is not None]
+    assert len(replies) % 5 != 0
+    assert run['authors'] == len(replies)
+    assert run['pages'] > 0
+    assert run['dialogs'] > 0
@@ -0,0 +1,80 @@
+import argparse
+import json
+
+import pytest
+
+pytest.importorskip('six')
+
+import view_dialogs
+from binary_store import (BinaryDialogStore, BinaryDialogWriter,
+                          export_csv, export_json, import_csv, import_json)
+
+
+def tweet(tid, reply_id, screen_name, name, text, lang='en'):
+    return {'id': tid, 'id_str': str(tid), 'in_reply_to_status_id': reply_id,
+            'created_at': 'Wed Oct 10 20:%02d:24 +0000 2018' % (tid % 60),
+            'lang': lang, 'text': text, 'retweet_count': 0,
+            'user': {'id': len(name), 'screen_name': screen_name,
+                     'name': name, 'lang': lang}}
+
+
+DIALOGS = {
+    '102': [tweet(100, None, 'alice', 'Alice A.', 'hi there'),
+            tweet(101, 100, 'bob', 'Bob ☃', 'hello, alice\nhow are you?'),
+            tweet(102, 101, 'alice', 'Alice A.', 'fine \U0001f642')],
+    '201': [tweet(200, None, 'carol', 'Carol', 'hola', lang='es'),
+            tweet(201, 200, 'alice', 'Alice A.', 'buenas', lang='es')],
+}
+
+FIELDS = ['id', 'in_reply_to_status_id', 'created_at', 'lang', 'text']
+
+
+def store_of(tmp_path, importer, fn):
+    path = str(tmp_path / 'corpus.tdb')
+    with BinaryDialogWriter(path, flush_rows=2) as writer:
+        importer(writer, fn)
+    return BinaryDialogStore(path)
+
+
+def test_json_round_trip(tmp_path, capsys):
+    source = tmp_path / 'dialogs.json'
+    source.write_text(json.dumps(DIALOGS))
+    store = store_of(tmp_path, import_json, str(source))
+    exported = str(tmp_path / 'exported.json')
+    export_json(store, exported)
+    store.close()
+
+    args = argparse.Namespace(min_length=None, max_length=None, lang='any',
+                              user=None)
+    dialogs = {}
+    for tid, dialog, offset, length in view_dialogs.iter_json(exported):
+        assert view_dialogs.matches(dialog, args)
+        view_dialogs.print_dialog(tid, dialog)
+        dialogs[tid] = dialog
+    assert 'Bob ☃ (@bob) : hello, alice' in capsys.readouterr().out
+
+    assert sorted(dialogs) == sorted(DIALOGS)
+    for tid, dialog in dialogs.items():
+        for got, expected in zip(dialog, DIALOGS[tid]):
+            assert dict((k, got[k]) for k in FIELDS) == \
+                dict((k, expected[k]) for k in FIELDS)
+            assert got['user'] == {'screen_name': expected['user']['screen_name'],
+                                   'name': expected['user']['name']}
+
+    args.lang = 'es'
+    assert [tid for tid, dialog in dialogs.items()
+            if view_dialogs.matches(dialog, args)] == ['201']
+
+
+def test_csv_round_trip(tmp_path):
+    rows = ['100,0,100,alice,hi there', '100,1,101,bob,"hello, alice"',
+            '200,0,200,carol,hola']
+    source = tmp_path / 'output.csv'
+    source.write_text('\n'.join(rows) + '\n')
+    store = store_of(tmp_path, import_csv, str(source))
+    exported = tmp_path / 'exported.csv'
+    export_csv(store, str(exported))
+    assert store.tweet(1)['user'] == {'screen_name': 'bob', 'name': ''}
+    assert store.tweet(1)['created_at'] == ''
+    store.close()
+    assert exported.read_text().splitlines() == rows
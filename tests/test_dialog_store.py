@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from dialog_store import JSONLinesDialogStore
+
+
+def dialog(*ids):
+    return [{'id': tid, 'in_reply_to_status_id': None, 'text': str(tid)}
+            for tid in ids]
+
+
+def test_update_appends_and_supersedes(tmp_path):
+    path = str(tmp_path / 'account')
+    store = JSONLinesDialogStore(path)
+    store.update({'11': dialog(10, 11), '21': dialog(20, 21)}, set())
+    assert store.since_id() == 21
+
+    store = JSONLinesDialogStore(path) # reads the index only
+    assert store.since_id() == 21
+    # 21 is extended by 22
+    store.update({'22': dialog(20, 21, 22)}, {'21'})
+    assert [tid for tid, _ in JSONLinesDialogStore(path)] == ['11', '22']
+    assert len(store) == 2
+    assert len(JSONLinesDialogStore(path)) == 2
+
+
+def test_index_holds_no_dialog_ids(tmp_path):
+    path = str(tmp_path / 'account')
+    store = JSONLinesDialogStore(path)
+    store.update(dict((str(tid), dialog(tid - 1, tid))
+                      for tid in range(2, 2000, 2)), set())
+    store.update({'3001': dialog(1997, 1998, 3000, 3001)}, {'1998'})
+    index = json.load(open(path + '.idx.json'))
+    assert index == {'since_id': 3001, 'records': 1000,
+                     'superseded': ['1998']}
+    assert len(store) == 999
+
+
+def user_tweet(tid, screen_name):
+    return {'id': tid, 'user': {'screen_name': screen_name}}
+
+
+def test_only_the_extended_dialog_is_superseded():
+    collect = pytest.importorskip('collect_twitter_dialogs')
+    # the account's dialog ending in 30 was stored, up to tweet 50
+    dialog = [user_tweet(5, 'other'), user_tweet(10, 'Account'),
+              user_tweet(20, 'other'), user_tweet(30, 'account'),
+              user_tweet(40, 'other'), user_tweet(60, 'other'),
+              user_tweet(200, 'account')]
+    assert collect.extended_dialog(dialog, 'account', 50) == ['30']
+    assert collect.extended_dialog(dialog, 'account', 25) == ['10']
+    assert collect.extended_dialog(dialog, 'account', None) == []
@@ -0,0 +1,20 @@
+import os
+import signal
+import time
+
+from dialog_writer import DialogWriter
+
+
+def test_sigint_keeps_buffered_rows(tmp_path):
+    path = str(tmp_path / 'output.csv')
+    writer = DialogWriter(path, flush_interval=60)
+    writer.start()
+    for i in range(100):
+        writer.write('{},0,{},user,text\n'.format(i, i))
+    time.sleep(0.5) # the rows are in the buffer, not on disk
+    os.kill(writer.process.pid, signal.SIGINT) # as Ctrl-C does
+    time.sleep(0.2)
+    assert writer.process.is_alive()
+    writer.close()
+    with open(path) as f:
+        assert len(f.readlines()) == 100
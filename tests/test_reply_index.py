@@ -0,0 +1,33 @@
+from reply_index import ReplyIndex
+
+
+def tweet(tid, reply_id=None):
+    return {'id': tid, 'in_reply_to_status_id': reply_id}
+
+
+TWEETS = [tweet(1), tweet(2, 1), tweet(4, 3), tweet(6, 5), tweet(5, 2)]
+
+
+def test_add_returns_missing_sources():
+    index = ReplyIndex()
+    assert index.add(TWEETS) == {3}
+
+
+def test_add_generator():
+    index = ReplyIndex()
+    missing = index.add(t for t in TWEETS)
+    assert missing == {3}
+    assert all(t['id'] in index for t in TWEETS)
+
+
+def test_source_after_reply_is_not_missing():
+    index = ReplyIndex()
+    assert index.add(iter([tweet(2, 1), tweet(1)])) == set()
+
+
+def test_dialogs():
+    index = ReplyIndex(iter(TWEETS))
+    terminals = sorted(TWEETS, key=lambda t: t['id'], reverse=True)
+    dialogs = [(tid, [t['id'] for t in dialog])
+               for tid, dialog in index.dialogs(terminals)]
+    assert dialogs == [(6, [1, 2, 5, 6]), (4, [4])]
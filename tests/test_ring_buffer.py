@@ -0,0 +1,37 @@
+import multiprocessing as mp
+
+from time import time
+
+from ring_buffer import RingBuffer
+
+
+def consume(ring, n, results):
+    records = []
+    while len(records) < n:
+        assert ring.wait(timeout=5)
+        records.extend(ring.get())
+    results.put([r[:2] for r in records])
+
+
+def test_put_wakes_a_waiting_consumer():
+    ring = RingBuffer(capacity=8)
+    results = mp.Queue()
+    process = mp.Process(target=consume, args=(ring, 20, results))
+    process.start()
+    sent = []
+    for i in range(20):
+        while not ring.put('user%d' % i, i, None, time()):
+            pass # full: the consumer is behind
+        sent.append(('user%d' % i, str(i)))
+    assert results.get(timeout=10) == sent
+    process.join()
+    assert process.exitcode == 0
+
+
+def test_wait_times_out_on_an_empty_buffer():
+    ring = RingBuffer(capacity=8)
+    start = time()
+    assert not ring.wait(timeout=0.1)
+    assert time() - start >= 0.1
+    ring.put('user', 1, None, time())
+    assert ring.wait(timeout=0)
@@ -0,0 +1,39 @@
+import glob
+import os
+
+import pytest
+
+from conftest import FIXTURES
+
+pytest.importorskip('bs4')
+pytest.importorskip('lxml')
+
+from scraping import Tweet
+
+PAGES = sorted(glob.glob(os.path.join(FIXTURES, 'pages', '*.html')))
+
+
+def fields(tweet):
+    return (tweet.user, tweet.id, tweet.convo_id, tweet.fullname, tweet.text)
+
+
+def parse(path, parser):
+    with open(path, encoding='utf-8') as f:
+        return list(Tweet.from_conversation(f.read(), parser=parser))
+
+
+@pytest.mark.parametrize('path', PAGES, ids=os.path.basename)
+def test_parsers_agree(path):
+    assert [fields(t) for t in parse(path, 'lxml')] == \
+        [fields(t) for t in parse(path, 'bs4')]
+
+
+def test_pages_have_tweets():
+    # a parser that finds nothing would agree with the other one too
+    assert sum(len(parse(path, 'lxml')) for path in PAGES) > 0
+
+
+@pytest.mark.parametrize('path', PAGES, ids=os.path.basename)
+def test_lxml_text_is_plain_str(path):
+    for tweet in parse(path, 'lxml'):
+        assert type(tweet.text) is str
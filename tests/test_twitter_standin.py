@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+import scraping
+from scraping import Tweet
+from twitter_api import RateLimitTracker
+from twitter_standin import RATE_LIMITS, RateLimits, StandinServer, World
+
+
+@pytest.fixture
+def standin():
+    servers = []
+
+    def start(**kwargs):
+        server = StandinServer(('127.0.0.1', 0), World(n_users=50),
+            RateLimits(RATE_LIMITS), lambda: 0, lambda: 0, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_timelines_carry_conversation_ids(standin, monkeypatch):
+    monkeypatch.setattr(scraping, 'API_URL', standin() + '/1.1')
+    tweets = list(Tweet.from_timeline('user1', reply_only=True))
+    assert tweets
+    assert all(t.convo_id != t.id for t in tweets)
+    # several replies of a thread are grouped into one page download
+    latest = Tweet.latest_per_conversation(tweets)
+    assert len(latest) < len(tweets)
+
+
+def test_pages_match_the_api(standin):
+    url = standin()
+    timeline = requests.get(url + '/1.1/statuses/user_timeline.json',
+        params={'screen_name': 'user1'}).json()
+    tweet = timeline[0]
+    page = requests.get('{}/i/web/status/{}'.format(url, tweet['id'])).text
+    parsed = list(Tweet.from_conversation(page))
+    assert parsed[-1].id == tweet['id_str']
+    assert all(t.convo_id == str(tweet['conversation_id']) for t in parsed)
+
+
+def test_injected_429_reports_no_requests_left(standin):
+    url = standin(throttle_rate=1.0)
+    response = requests.get(url + '/1.1/statuses/lookup.json',
+        params={'id': '1'})
+    assert response.status_code == 429
+    assert response.headers['X-Rate-Limit-Remaining'] == '0'
+
+    tracker = RateLimitTracker()
+    tracker.update('/statuses/lookup', response.headers)
+    assert tracker.remaining('/statuses/lookup') == 0
+    assert tracker.wait_time('/statuses/lookup') > 0
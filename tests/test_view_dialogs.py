@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+
+import pytest
+
+pytest.importorskip('six')
+
+import view_dialogs
+from dialog_store import JSONLinesDialogStore
+
+
+def tweet(tid, reply_id=None):
+    return {'id': tid, 'in_reply_to_status_id': reply_id, 'lang': 'en',
+            'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'text': str(tid),
+            'user': {'screen_name': 'user%d' % tid, 'name': 'User'}}
+
+
+def args(**kwargs):
+    defaults = dict(min_length=None, max_length=None, lang='any', user=None,
+                    id=None, build_index=False, files=[])
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def lookup(fn, tid):
+    index = view_dialogs.OffsetIndex(fn)
+    found = index.lookup(tid)
+    with open(fn, 'rb') as f:
+        return view_dialogs.read_dialog(f, *found)
+
+
+def test_index_of_rewritten_json_is_rebuilt(tmp_path, capsys):
+    fn = str(tmp_path / 'account.json')
+    with open(fn, 'w') as f:
+        json.dump({'2': [tweet(1), tweet(2, 1)]}, f)
+    view_dialogs.Main(args(build_index=True, files=[fn]))
+    assert view_dialogs.OffsetIndex(fn).is_current()
+
+    # a later run of collect_twitter_dialogs rewrites the file
+    with open(fn, 'w') as f:
+        json.dump({'4': [tweet(3), tweet(4, 3)],
+                   '2': [tweet(1), tweet(2, 1)]}, f, indent=2)
+    os.utime(fn, ns=(0, 0)) # even if the clock didn't move
+    assert not view_dialogs.OffsetIndex(fn).is_current()
+
+    capsys.readouterr()
+    view_dialogs.Main(args(id=[2], files=[fn]))
+    captured = capsys.readouterr()
+    assert '--- ID:2 (length=2) ---' in captured.out
+    assert 're-indexed 2 dialogs' in captured.err
+    assert [t['id'] for t in lookup(fn, 4)] == [3, 4]
+
+
+def test_index_of_appended_jsonl_is_rebuilt(tmp_path, capsys):
+    path = str(tmp_path / 'account')
+    store = JSONLinesDialogStore(path)
+    store.update({'2': [tweet(1), tweet(2, 1)]}, set())
+    view_dialogs.Main(args(build_index=True, files=[store.path]))
+
+    store.update({'3': [tweet(1), tweet(2, 1), tweet(3, 2)]}, {'2'})
+    view_dialogs.Main(args(id=[3], files=[store.path]))
+    assert '--- ID:3 (length=3) ---' in capsys.readouterr().out
+    # superseded
+    assert view_dialogs.OffsetIndex(store.path).lookup(2) is None
+
+
+def test_index_is_built_before_printing(tmp_path, monkeypatch):
+    fn = str(tmp_path / 'account.json')
+    with open(fn, 'w') as f:
+        json.dump({'2': [tweet(1), tweet(2, 1)], '4': [tweet(3), tweet(4, 3)]}, f)
+
+    def closed_pipe(tid, dialog): # as with view_dialogs.py | head
+        raise BrokenPipeError()
+    monkeypatch.setattr(view_dialogs, 'print_dialog', closed_pipe)
+    with pytest.raises(BrokenPipeError):
+        view_dialogs.Main(args(build_index=True, files=[fn]))
+    assert view_dialogs.OffsetIndex(fn).is_current()
+    assert lookup(fn, 4) is not None
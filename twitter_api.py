@@ -14,22 +14,287 @@ import json
 import sys
 import six
 import os
-import re
 import time
 import logging
+import random
+import threading
+import requests
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # get a logger object
 logger = logging.getLogger('root')
 
+# can point to a local stand-in (see twitter_standin.py) for testing
+REST_API_URL = 'https://api.twitter.com/1.1'
+
+
+class RateLimitTracker(object):
+    '''
+      Keeps the remaining requests and the reset time of each endpoint
+      for one set of credentials, as reported by the X-Rate-Limit-* headers
+      of every response, or by /application/rate_limit_status when the
+      headers are missing
+    '''
+    def __init__(self):
+        self.limits = {} # command -> [remaining, reset]
+        self.lock = threading.Lock()
+
+    @classmethod
+    def of(cls, session):
+        '''
+        the tracker shared by all API objects using the same session
+        '''
+        if not hasattr(session, 'rate_limit_tracker'):
+            session.rate_limit_tracker = cls()
+        return session.rate_limit_tracker
+
+    def update(self, command, headers):
+        '''
+        record the limits reported by a response to command
+        '''
+        with self.lock:
+            if 'X-Rate-Limit-Remaining' in headers \
+            and 'X-Rate-Limit-Reset' in headers:
+                self.limits[command] = [int(headers['X-Rate-Limit-Remaining']),
+                                        int(headers['X-Rate-Limit-Reset'])]
+            elif command in self.limits:
+                # no headers: count the request ourselves
+                limit = self.limits[command]
+                limit[0] = max(limit[0] - 1, 0)
+
+    def update_from_status(self, res_text):
+        '''
+        record the limits of all endpoints from a rate_limit_status response
+        '''
+        with self.lock:
+            for category in res_text['resources'].values():
+                for command, limit in category.items():
+                    self.limits[command] = [int(limit['remaining']),
+                                            int(limit['reset'])]
+
+    def remaining(self, command):
+        '''
+        requests left for command in the current window, or None if unknown
+        '''
+        with self.lock:
+            if command not in self.limits:
+                return None
+            remaining, reset = self.limits[command]
+        if time.mktime(datetime.now().timetuple()) >= reset:
+            return None # the window is over, our data is stale
+        return remaining
+
+    def wait_time(self, command):
+        '''
+        seconds to wait before calling command, or None if unknown
+        '''
+        remaining = self.remaining(command)
+        if remaining is None:
+            return None
+        if remaining > 0:
+            return 0
+        with self.lock:
+            reset = self.limits[command][1]
+        return reset - time.mktime(datetime.now().timetuple())
+
+
+class SessionPool(object):
+    '''
+      A set of sessions, one per set of credentials. Each request goes
+      through the session with the most remaining requests for its endpoint,
+      so we only wait when all of them reached the rate limit
+    '''
+    def __init__(self, sessions, report_every=100):
+        self.sessions = list(sessions)
+        self.report_every = report_every
+        self.n_requests = 0
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def of(cls, session):
+        '''
+        a pool of the given session, or the session itself if it is a pool
+        '''
+        if isinstance(session, cls):
+            return session
+        if not hasattr(session, 'session_pool'):
+            session.session_pool = cls([session])
+        return session.session_pool
+
+    def select(self, command):
+        '''
+        the session with the most remaining requests for command;
+        sessions we know nothing about yet are tried first
+        '''
+        best, best_remaining = None, -1
+        for session in self.sessions:
+            remaining = RateLimitTracker.of(session).remaining(command)
+            if remaining is None:
+                return session
+            if remaining > best_remaining:
+                best, best_remaining = session, remaining
+        return best
+
+    def remaining(self, command):
+        '''
+        requests left for command across all sessions, or None if unknown
+        '''
+        remainings = [RateLimitTracker.of(session).remaining(command)
+                      for session in self.sessions]
+        if None in remainings:
+            return None
+        return sum(remainings)
+
+    def wait_time(self, command):
+        '''
+        seconds until any session can call command, or None if unknown
+        '''
+        waittimes = [RateLimitTracker.of(session).wait_time(command)
+                     for session in self.sessions]
+        if None in waittimes:
+            return None
+        return min(waittimes)
+
+    def count_request(self):
+        with self.lock:
+            self.n_requests += 1
+            if self.n_requests % self.report_every == 0:
+                elapsed = time.time() - self.start_time
+                logger.info('%d requests with %d credential(s) in %d seconds (%.2f requests/s)'
+                            % (self.n_requests, len(self.sessions), elapsed,
+                               self.n_requests / elapsed))
+
+
+class RetryPolicy(object):
+    '''
+      Decides how long to wait before retrying a failed request, and keeps
+      count of the retries and of the time slept per endpoint.
+      Rate limit errors (420/429) wait until the limit resets, as told by
+      Retry-After or X-Rate-Limit-Reset, unless another session can take
+      the request. Server and network errors back off exponentially with
+      full jitter, capped at max_delay, and draw from a per-endpoint budget
+      of budget retries per budget_window seconds, so an endpoint that
+      keeps failing gives up instead of retrying for hours
+    '''
+    rate_limit_codes = (420, 429)
+
+    def __init__(self, base_delay=1.0, max_delay=300.0, budget=30,
+                 budget_window=900):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.budget_window = budget_window
+        self.budgets = {} # command -> [retries left, time of last refill]
+        self.stats = {} # (command, kind) -> [retries, seconds slept]
+        self.lock = threading.Lock()
+
+    @classmethod
+    def of(cls, pool):
+        '''
+        the policy shared by all API objects using the same session pool
+        '''
+        if not hasattr(pool, 'retry_policy'):
+            pool.retry_policy = cls()
+        return pool.retry_policy
+
+    def delay(self, command, res, attempt, can_switch=False):
+        '''
+        seconds to wait before retrying command after the response res
+        (None if the request failed), and the kind of error. can_switch
+        tells if another session can take the request.
+        Raises an exception if the retry budget of command is exhausted
+        '''
+        if res is not None and res.status_code in self.rate_limit_codes:
+            if can_switch:
+                return 0, 'rate_limit'
+            waittime = retry_after(res.headers)
+            if waittime is None and 'X-Rate-Limit-Reset' in res.headers:
+                waittime = int(res.headers['X-Rate-Limit-Reset']) - time.time()
+            if waittime is None:
+                waittime = self.backoff(attempt)
+            return max(waittime, 0) + 1, 'rate_limit'
+
+        if not self.take(command):
+            raise Exception('retry budget of %s exhausted (%d retries in %d seconds)'
+                            % (command, self.budget, self.budget_window))
+        waittime = self.backoff(attempt)
+        if res is not None and retry_after(res.headers) is not None:
+            waittime = max(waittime, retry_after(res.headers))
+        return waittime, 'server_error'
+
+    def backoff(self, attempt):
+        '''
+        a random delay up to base_delay * 2^attempt, capped at max_delay
+        '''
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** attempt))
+
+    def take(self, command):
+        '''
+        use a retry of the budget of command, refilled every budget_window
+        '''
+        now = time.time()
+        with self.lock:
+            budget = self.budgets.setdefault(command, [self.budget, now])
+            if now - budget[1] >= self.budget_window:
+                budget[:] = [self.budget, now]
+            if budget[0] <= 0:
+                return False
+            budget[0] -= 1
+            return True
+
+    def sleep(self, command, kind, seconds):
+        '''
+        wait, counting the time under command and kind
+        ('rate_limit', 'server_error' or 'window')
+        '''
+        with self.lock:
+            stats = self.stats.setdefault((command, kind), [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def report(self):
+        '''
+        log the retries and the time slept for each endpoint
+        '''
+        with self.lock:
+            stats = sorted(self.stats.items())
+        for (command, kind), (n, slept) in stats:
+            logger.info('%s: %d %s waits, %.1f seconds slept' % (command, n, kind, slept))
+
+
+def retry_after(headers):
+    '''
+    seconds given by a Retry-After header (a number or a date), or None
+    '''
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
 # base API caller
 class TwitterAPI(object):
     def __init__(self, command, session):
-        self.rest_api_url = 'https://api.twitter.com/1.1'
+        self.rest_api_url = REST_API_URL
         self.error_code_url = 'https://dev.twitter.com/overview/api/response-codes'
         self.check_rate_limits = '/application/rate_limit_status'
         self.command = command
-        self.session = session
+        self.session = session # a session or a SessionPool
+        self.pool = SessionPool.of(session)
+        self.retry = RetryPolicy.of(self.pool)
         self.params = {}
 
     def call(self, retry=5):
@@ -45,8 +310,22 @@ class TwitterAPI(object):
         while True:
             logger.debug('URL: ' + url)
             logger.debug('params: ' + str(self.params))
-            res = self.session.get(url, params = self.params)
-            if res.status_code == 200: # Success
+            session = self.pool.select(self.command)
+            try:
+                res = session.get(url, params = self.params)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                logger.warn('error occurred in %s: %s' % (self.command, e))
+                res = None
+            else:
+                RateLimitTracker.of(session).update(self.command, res.headers)
+            self.pool.count_request()
+            if res is None:
+                n_errors += 1
+                if n_errors > retry:
+                    raise Exception('%s failed %d times' % (self.command, n_errors))
+                self.waitRetry(session, None, n_errors)
+            elif res.status_code == 200: # Success
                 data = json.loads(res.text)
                 if len(data) == 0:
                     break
@@ -54,33 +333,41 @@ class TwitterAPI(object):
                     break
                 n_errors = 0
 
-                # check if header includes 'X-Rate-Limit-Remaining'
-                if 'X-Rate-Limit-Remaining' in res.headers \
-                and 'X-Rate-Limit-Reset' in res.headers:
-                    if int(res.headers['X-Rate-Limit-Remaining']) == 0:
-                        waittime = int(res.headers['X-Rate-Limit-Reset']) \
-                                    - time.mktime(datetime.now().timetuple())
-                        logger.info('reached the rate limit ... wait %d seconds', waittime + 5)
-                        time.sleep(waittime + 5)
-                        self.waitReady(self.session)
-                else:
-                    self.waitReady(self.session)
+                # wait if the rate limit is reached (checks the server only
+                # if neither the headers nor a previous check told us)
+                self.waitReady()
 
             elif res.status_code==401 or res.status_code==404:
                 logger.warn('Twitter API error %d, see %s' % (res.status_code, self.error_code_url))
                 logger.warn('error occurred in %s' % self.command)
                 return None
             else:
-                n_errors += 1
-                if n_errors > retry:
-                    raise Exception('Twitter API error %d, see %s' % (res.status_code, self.error_code_url))
-
                 logger.warn('Twitter API error %d, see %s' % (res.status_code, self.error_code_url))
-                logger.warn('Service Unavailable ... wait 15 minutes')
-                time.sleep(905)
+                if res.status_code not in RetryPolicy.rate_limit_codes:
+                    # rate limit errors are waited out, not counted
+                    n_errors += 1
+                    if n_errors > retry:
+                        raise Exception('Twitter API error %d, see %s' % (res.status_code, self.error_code_url))
+                self.waitRetry(session, res, n_errors)
 
         return self.result
 
+    def waitRetry(self, session, res, attempt, command=None):
+        '''
+        wait as long as the retry policy says after a failed request of
+        session. A command is given for requests bound to that session
+        (see checkRateLimits), otherwise another session may take over
+        '''
+        if command is None:
+            command = self.command
+            can_switch = self.pool.select(command) is not session
+        else:
+            can_switch = False
+        waittime, kind = self.retry.delay(command, res, attempt, can_switch)
+        if waittime > 0:
+            logger.warn('%s: retry in %.1f seconds (%s)' % (command, waittime, kind))
+        self.retry.sleep(command, kind, waittime)
+
     # parameter setting
     def _set_param(self, key, value, default=None):
         if value is None: # if value is None, the parameter is removed
@@ -90,43 +377,55 @@ class TwitterAPI(object):
             self.params[key] = value
 
 
-    def getWaitTime(self, res_text):
-        waittime = 0
-        for command in [self.command, self.check_rate_limits]:
-            category = re.sub(r'^/([^\s\/]+)/.*$', '\\1', command)
-            remaining = int(res_text['resources'][category][command]['remaining'])
-            reset = int(res_text['resources'][category][command]['reset'])
-            if remaining == 0:
-                waittime = max(waittime, reset - time.mktime(datetime.now().timetuple()))
+    def checkRateLimits(self, session, retry=5):
+        '''
+        ask the server for the rate limits of a session
+        '''
+        tracker = RateLimitTracker.of(session)
+        n_errors = 0
+        while True:
+            # don't exceed the limit of rate_limit_status itself
+            waittime = tracker.wait_time(self.check_rate_limits)
+            if waittime:
+                logger.info('reached the rate limit ... wait %d seconds' % (waittime+5))
+                self.retry.sleep(self.check_rate_limits, 'window', waittime+5)
+
+            try:
+                res = session.get(self.rest_api_url + self.check_rate_limits + '.json')
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                logger.warn('error occurred in %s: %s' % (self.check_rate_limits, e))
+                res = None
+            self.pool.count_request()
+            if res is not None and res.status_code == 200: # Success
+                tracker.update_from_status(json.loads(res.text))
+                break
 
-        return waittime
+            else:
+                if res is not None:
+                    logger.warn('Twitter API error %d, see %s' % (res.status_code, self.error_code_url))
+                    tracker.update(self.check_rate_limits, res.headers)
+                if res is None or res.status_code not in RetryPolicy.rate_limit_codes:
+                    n_errors += 1
+                    if n_errors > retry:
+                        raise Exception('%s failed %d times' % (self.check_rate_limits, n_errors))
+                self.waitRetry(session, res, n_errors, self.check_rate_limits)
 
 
     def waitReady(self, retry=5):
         '''
         check status, and wait until it gets available
         '''
-        n_errors = 0
-        while True:
-            res = self.session.get(self.rest_api_url + self.check_rate_limits + '.json')
-            if res.status_code == 200: # Success
-                res_text = json.loads(res.text)
-                waittime = self.getWaitTime(res_text)
-                if (waittime > 0):
-                    logger.info('reached the rate limit ... wait %d seconds' % (waittime+5))
-                    time.sleep(waittime+5)
-                    n_errors = 0
-                else:
-                    break
+        # ask the server only about the sessions we know nothing about
+        for session in self.pool.sessions:
+            if RateLimitTracker.of(session).wait_time(self.command) is None:
+                self.checkRateLimits(session, retry)
 
-            else:
-                n_errors += 1
-                if n_errors > retry:
-                    raise Exception('Twitter API error %d, see %s' % (res.status_code, self.error_code_url))
-
-                logger.warn('Twitter API error %d, see %s' % (res.status_code, self.error_code_url))
-                logger.warn('Service Unavailable ... wait 15 minutes')
-                time.sleep(905)
+        # wait only if every session reached the rate limit
+        waittime = self.pool.wait_time(self.command)
+        if waittime:
+            logger.info('reached the rate limit ... wait %d seconds' % (waittime+5))
+            self.retry.sleep(self.command, 'window', waittime+5)
 
 
 ## some methods to get data
@@ -256,6 +555,32 @@ class GETStatusesLookup(TwitterAPI):
         self.params['id'] = ','.join([str(n) for n in sub_ids])
         return True
 
+    def callConcurrently(self, id_set, max_workers=8):
+        '''
+        acquire tweets for all ids in id_set, sending up to max_workers
+        chunks of ids at once, but no more than the remaining rate limit allows
+        '''
+        id_list = list(id_set)
+        chunks = [id_list[i:i+self.count] for i in range(0, len(id_list), self.count)]
+        self.result = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while len(chunks) > 0:
+                self.waitReady()
+                budget = self.pool.remaining(self.command) or 1
+                n_chunks = max(1, min(len(chunks), max_workers, budget))
+                futures = [executor.submit(self._callChunk, chunk)
+                           for chunk in chunks[:n_chunks]]
+                chunks = chunks[n_chunks:]
+                for future in futures:
+                    self.result.extend(future.result())
+        return self.result
+
+    def _callChunk(self, chunk):
+        # each chunk needs its own params and result
+        lookup = GETStatusesLookup(self.session)
+        lookup.setParams(chunk)
+        return lookup.call() or []
+
 
 class GETUsersSearch(TwitterAPI):
     '''
@@ -18,35 +18,21 @@ import os
 import re
 import time
 import logging
-from requests_oauthlib import OAuth1Session
+from credentials import get_session_pool
+from reply_index import ReplyIndex
 from twitter_api import GETStatusesUserTimeline
 from twitter_api import GETStatusesLookup
 import tweepy
 
-try:
-    from configparser import ConfigParser
-except ImportError:
-    from ConfigParser import SafeConfigParser as ConfigParser
-
 # create logger object
 logger = logging.getLogger("root")
 logger.setLevel(logging.INFO)
 
 
 def get_session(config_path):
-    # get access keys from a config file
-    config = ConfigParser()
-    config.read(config_path)
-    ConsumerKey = config.get('AccessKeys','ConsumerKey')
-    ConsumerSecret = config.get('AccessKeys','ConsumerSecret')
-    AccessToken = config.get('AccessKeys','AccessToken')
-    AccessTokenSecret = config.get('AccessKeys','AccessTokenSecret')
-
-    return OAuth1Session(
-        ConsumerKey,
-        ConsumerSecret,
-        AccessToken,
-        AccessTokenSecret)
+    # get a pool of sessions, one per set of access keys in the config file;
+    # the API objects route each request to the least used one
+    return get_session_pool([config_path])
 
 def get_dialogs(session, username, count):
     # setup API object
@@ -68,55 +54,25 @@ def get_dialogs(session, username, count):
     if not timeline_tweets:
         return []
 
-    ## collect source tweets
-    tweet_set = {}
-
     ## add new tweets and collect reply-ids as necessary
-    source_ids = set()
-    for tweet in timeline_tweets:
-        tweet_set[tweet['id']] = tweet
-        reply_id = tweet['in_reply_to_status_id']
-        if reply_id is not None and reply_id not in tweet_set:
-            source_ids.add(reply_id)
+    tweet_index = ReplyIndex()
+    source_ids = tweet_index.add(timeline_tweets)
 
     ## acquire source tweets
     get_lookup.waitReady()
     while len(source_ids) > 0:
-        get_lookup.setParams(source_ids)
-        result = get_lookup.call()
-        new_source_ids = set()
-        for tweet in result:
-            tweet_set[tweet['id']] = tweet
-            reply_id = tweet['in_reply_to_status_id']
-            if reply_id is not None and reply_id not in tweet_set:
-                new_source_ids.add(reply_id)
-        source_ids = new_source_ids
+        start_time = time.time()
+        result = get_lookup.callConcurrently(source_ids)
+        logger.info('obtained %d/%d tweets in %.2f seconds'
+                    % (len(result), len(source_ids), time.time() - start_time))
+        source_ids = tweet_index.add(result)
 
     ## reconstruct dialogs
-    visited = set()
-    new_dialogs = 0
-    for tweet in timeline_tweets:
-        tid = tweet['id']
-        if tid not in visited: # ignore visited node (it's not a terminal)
-            visited.add(tid)
-            # backtrack source tweets and make a dialog
-            dialog = [tweet]
-            reply_id = tweet_set[tid]['in_reply_to_status_id']
-            while reply_id is not None:
-                visited.add(reply_id)
-
-                if reply_id in tweet_set:
-                    dialog.insert(0,tweet_set[reply_id])
-                else:
-                    break
-                # move to the previous tweet
-                reply_id = tweet_set[reply_id]['in_reply_to_status_id']
-
-            # add the dialog only if it contains two or more turns,
-            # where it is associated with its terminal tweet id.
-            if len(dialog) > 1:
-                dialog_set[str(tid)] = dialog
-                new_dialogs += 1
+    for tid, dialog in tweet_index.dialogs(timeline_tweets):
+        # add the dialog only if it contains two or more turns,
+        # where it is associated with its terminal tweet id.
+        if len(dialog) > 1:
+            dialog_set[str(tid)] = dialog
 
     return list(dialog_set.values())
 
@@ -0,0 +1,439 @@
+"""A local stand-in for twitter.com and the REST API 1.1, for load tests that
+shouldn't burn real quota.
+
+Usage: python twitter_standin.py [--port 8320] [--api_latency lognormal:-3,0.5]
+                                 [--page_latency uniform:0.05,0.3]
+                                 [--error_rate 0.01] [--throttle_rate 0.01]
+
+Then point the scripts at it:
+
+  python getdialogs.py --twitter_url=http://127.0.0.1:8320 \\
+        --api_url=http://127.0.0.1:8320/1.1 output.csv
+  python collect_twitter_dialogs.py --api_url=http://127.0.0.1:8320/1.1 NAME
+
+It serves statuses/user_timeline, statuses/lookup, search/tweets,
+users/search, application/rate_limit_status and the status permalink pages
+(/i/web/status/<id>), from a synthetic population of users. The timeline of
+each user is generated the first time it's requested, deterministically from
+the user name, and is made of conversations with other users, so lookups and
+permalink pages of every tweet served are consistent.
+
+Rate limits are counted per credential (the OAuth token or bearer token of a
+request) in windows of --window seconds, with the per-endpoint limits of the
+real API. Every API response carries X-Rate-Limit-Limit/-Remaining/-Reset,
+and a request over the limit gets a 429. On top of that, --error_rate of the
+requests fail with a 503 (with a Retry-After header if --retry_after is set),
+and --throttle_rate of them get a spurious 429. Like a real one, a spurious 429
+reports no requests remaining until the end of the window, so clients wait for
+the reset; use a short --window to keep load tests moving.
+
+Tweets carry a conversation_id (the id of the first tweet of the thread),
+which the real API leaves out but scraping.Tweet.from_timeline reads when
+present, so conversations can be grouped without fetching their pages.
+
+Latencies are drawn from a distribution, given as <name>:<params>:
+  const:S          always S seconds
+  uniform:A,B      between A and B seconds
+  exp:M            exponential with mean M seconds
+  lognormal:MU,SD  exp() of a normal with mean MU and deviation SD
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import zlib
+
+from email.utils import formatdate
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from time import time, sleep
+
+# requests per window of each endpoint, as in the real API (user auth)
+RATE_LIMITS = {
+    '/statuses/user_timeline': 900,
+    '/statuses/lookup': 900,
+    '/search/tweets': 180,
+    '/users/search': 900,
+    '/application/rate_limit_status': 180,
+}
+
+WORDS = ('the of and to a in is you that it he was for on are as with his they '
+         'at be this have from or one had by word but not what all were we when '
+         'your can said there use an each which she do how their if will up '
+         'other about out many then them these so some her would make like him '
+         'into time has look two more write go see number no way could people').split()
+
+
+def parse_latency(spec):
+    """
+    Returns a function that draws a latency (in seconds) from the
+    distribution described by spec, e.g. 'uniform:0.05,0.3'.
+    """
+    name, _, params = spec.partition(':')
+    params = [float(p) for p in params.split(',') if p]
+    if name == 'const':
+        return lambda: params[0]
+    if name == 'uniform':
+        return lambda: random.uniform(params[0], params[1])
+    if name == 'exp':
+        return lambda: random.expovariate(1 / params[0]) if params[0] else 0
+    if name == 'lognormal':
+        return lambda: random.lognormvariate(params[0], params[1])
+    raise argparse.ArgumentTypeError("unknown latency distribution: " + spec)
+
+
+class World:
+    """
+    The synthetic users and tweets. Timelines are generated on demand and
+    kept, so every id handed out can be looked up later.
+    """
+
+    def __init__(self, n_users=10000, timeline_size=200, max_turns=8, seed=0,
+        start=None):
+        self.n_users = n_users
+        self.timeline_size = timeline_size
+        self.max_turns = max_turns
+        self.seed = seed
+        self.start = start # time of the first tweets; 30 days ago by default
+        self.tweets = {}     # id -> tweet json
+        self.timelines = {}  # screen name -> tweet ids, newest first
+        self.lock = threading.Lock()
+
+    def screen_name(self, i):
+        return 'user{}'.format(i)
+
+    def user(self, screen_name):
+        user_id = zlib.crc32(screen_name.encode('utf-8'))
+        return {
+            'id': user_id,
+            'id_str': str(user_id),
+            'screen_name': screen_name,
+            'name': screen_name.capitalize(),
+            'lang': 'en',
+            'protected': False,
+        }
+
+    def timeline(self, screen_name):
+        with self.lock:
+            if screen_name not in self.timelines:
+                self.timelines[screen_name] = self._generate(screen_name)
+            return self.timelines[screen_name]
+
+    def _generate(self, screen_name):
+        rng = random.Random(zlib.crc32(screen_name.encode('utf-8')) ^ self.seed)
+        # ids of a user are unique and increase with time
+        next_id = 10 ** 17 + (zlib.crc32(screen_name.encode('utf-8')) << 24)
+        created = self.start or int(time()) - 86400 * 30
+        own = []
+        while len(own) < self.timeline_size:
+            partner = self.screen_name(rng.randrange(self.n_users))
+            speakers = [screen_name, partner]
+            rng.shuffle(speakers)
+            previous = None
+            for turn in range(rng.randint(1, self.max_turns)):
+                next_id += rng.randint(1, 1000)
+                created += rng.randint(1, 3600)
+                speaker = speakers[turn % 2]
+                tweet = {
+                    'id': next_id,
+                    'id_str': str(next_id),
+                    'created_at': formatdate(created, usegmt=True),
+                    'text': ' '.join(rng.choice(WORDS)
+                                     for _ in range(rng.randint(3, 25))),
+                    'lang': 'en',
+                    'user': self.user(speaker),
+                    'in_reply_to_status_id':
+                        previous['id'] if previous else None,
+                    'in_reply_to_status_id_str':
+                        previous['id_str'] if previous else None,
+                    'in_reply_to_user_id':
+                        previous['user']['id'] if previous else None,
+                    'in_reply_to_screen_name':
+                        previous['user']['screen_name'] if previous else None,
+                    'conversation_id': previous['conversation_id']
+                        if previous else next_id,
+                }
+                self.tweets[next_id] = tweet
+                if speaker == screen_name:
+                    own.append(next_id)
+                previous = tweet
+        return sorted(own, reverse=True)
+
+    def get(self, tweet_id):
+        with self.lock:
+            return self.tweets.get(tweet_id)
+
+    def conversation(self, tweet_id):
+        """
+        The tweet and all the tweets it replies to, oldest first.
+        """
+        chain = []
+        tweet = self.get(tweet_id)
+        while tweet is not None:
+            chain.append(tweet)
+            tweet = self.get(tweet['in_reply_to_status_id'])
+        chain.reverse()
+        return chain
+
+
+def render_page(conversation):
+    """
+    A permalink page in the markup scraping.Tweet.from_conversation reads.
+    """
+    tweets = []
+    for tweet in conversation:
+        tweets.append(
+            '<div class="tweet js-stream-tweet" data-tweet-id="{}" '
+            'data-screen-name="{}" data-name="{}" data-conversation-id="{}">'
+            '<p class="TweetTextSize js-tweet-text tweet-text">{}</p></div>'
+            .format(tweet['id'], escape(tweet['user']['screen_name']),
+                escape(tweet['user']['name']), tweet['conversation_id'],
+                escape(tweet['text'])))
+    return ('<html><body><div id="permalink-overlay">{}</div></body></html>'
+        .format('\n'.join(tweets)))
+
+
+class RateLimits:
+    """
+    Requests left of each credential and endpoint in the current window.
+    """
+
+    def __init__(self, limits, window=900):
+        self.limits = limits
+        self.window = window
+        self.used = {} # (credential, endpoint) -> (window start, requests)
+        self.lock = threading.Lock()
+
+    def take(self, credential, endpoint):
+        """
+        Counts a request. Returns (limit, remaining, reset, allowed).
+        """
+        limit = self.limits[endpoint]
+        now = time()
+        with self.lock:
+            start, n = self.used.get((credential, endpoint), (now, 0))
+            if now - start >= self.window:
+                start, n = now, 0
+            allowed = n < limit
+            if allowed:
+                n += 1
+            self.used[(credential, endpoint)] = (start, n)
+        return limit, limit - n, int(start + self.window), allowed
+
+    def status(self, credential):
+        resources = {}
+        now = time()
+        with self.lock:
+            for endpoint, limit in self.limits.items():
+                start, n = self.used.get((credential, endpoint), (now, 0))
+                if now - start >= self.window:
+                    start, n = now, 0
+                category = endpoint.split('/')[1]
+                resources.setdefault(category, {})[endpoint] = {
+                    'limit': limit, 'remaining': limit - n,
+                    'reset': int(start + self.window)}
+        return {'resources': resources}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    api_re = re.compile(r'^/1\.1(/.+)\.json$')
+    page_re = re.compile(r'^/(?:i/web|[^/]+)/status/(\d+)$')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        server = self.server
+
+        api = self.api_re.match(url.path)
+        page = self.page_re.match(url.path)
+        if api and api.group(1) in RATE_LIMITS:
+            self.api(api.group(1), params)
+        elif page:
+            sleep(server.page_latency())
+            if self.inject_error():
+                return
+            conversation = server.world.conversation(int(page.group(1)))
+            if not conversation:
+                self.send(404, b'', 'text/html')
+            else:
+                self.send(200, render_page(conversation).encode('utf-8'),
+                    'text/html; charset=utf-8')
+        else:
+            self.send(404, b'', 'text/plain')
+        server.count(self.last_status)
+
+    def api(self, endpoint, params):
+        server = self.server
+        sleep(server.api_latency())
+        if self.inject_error():
+            return
+
+        credential = self.credential()
+        limit, remaining, reset, allowed = server.limits.take(credential, endpoint)
+        headers = {'X-Rate-Limit-Limit': limit,
+                   'X-Rate-Limit-Remaining': remaining,
+                   'X-Rate-Limit-Reset': reset}
+        if not allowed or random.random() < server.throttle_rate:
+            headers['X-Rate-Limit-Remaining'] = 0
+            self.send_json(429, {'errors': [
+                {'code': 88, 'message': 'Rate limit exceeded'}]}, headers)
+            return
+
+        world = server.world
+        if endpoint == '/statuses/user_timeline':
+            ids = world.timeline(params.get('screen_name', ''))
+            data = [world.get(i) for i in self.page_of_ids(ids, params)]
+        elif endpoint == '/statuses/lookup':
+            ids = [int(i) for i in params.get('id', '').split(',') if i]
+            data = [t for t in map(world.get, ids[:100]) if t]
+        elif endpoint == '/search/tweets':
+            # replies from random users, newest first across calls
+            rng = random.Random(params.get('q', '') + params.get('max_id', ''))
+            ids = []
+            for _ in range(min(int(params.get('count', 15)), 100)):
+                name = world.screen_name(rng.randrange(world.n_users))
+                ids.extend(world.timeline(name)[:1])
+            ids = self.page_of_ids(sorted(ids, reverse=True), params)
+            data = {'statuses': [world.get(i) for i in ids],
+                    'search_metadata': {'count': len(ids),
+                                        'query': params.get('q', '')}}
+        elif endpoint == '/users/search':
+            count = min(int(params.get('count', 20)), 20)
+            first = (int(params.get('page', 1)) - 1) * count
+            data = [world.user(world.screen_name(i))
+                    for i in range(first, min(first + count, world.n_users))]
+        else:
+            data = server.limits.status(credential)
+        self.send_json(200, data, headers)
+
+    def page_of_ids(self, ids, params):
+        max_id = int(params.get('max_id', 0))
+        since_id = int(params.get('since_id', 0))
+        count = min(int(params.get('count', 20)), 200)
+        ids = [i for i in ids if (not max_id or i <= max_id) and i > since_id]
+        return ids[:count]
+
+    def credential(self):
+        auth = self.headers.get('Authorization', '')
+        token = re.search(r'oauth_token="([^"]*)"', auth)
+        if token:
+            return token.group(1)
+        return auth or self.client_address[0]
+
+    def inject_error(self):
+        if random.random() >= self.server.error_rate:
+            return False
+        headers = {}
+        if self.server.retry_after:
+            headers['Retry-After'] = self.server.retry_after
+        self.send_json(503, {'errors': [
+            {'code': 130, 'message': 'Over capacity'}]}, headers)
+        return True
+
+    def send_json(self, status, data, headers=None):
+        self.send(status, json.dumps(data).encode('utf-8'),
+            'application/json; charset=utf-8', headers)
+
+    def send(self, status, body, content_type, headers=None):
+        self.last_status = status
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, world, limits, api_latency, page_latency,
+        error_rate=0.0, throttle_rate=0.0, retry_after=0, report_interval=60):
+        super().__init__(address, StandinHandler)
+        self.world = world
+        self.limits = limits
+        self.api_latency = api_latency
+        self.page_latency = page_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.report_interval = report_interval
+        self.statuses = {}
+        self.reported = time()
+        self.lock = threading.Lock()
+
+    def count(self, status):
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if time() - self.reported < self.report_interval:
+                return
+            elapsed = time() - self.reported
+            self.reported = time()
+            statuses, self.statuses = self.statuses, {}
+        logging.info("{} requests in {:.0f}s ({:.1f}/s), by status: {}".format(
+            sum(statuses.values()), elapsed, sum(statuses.values()) / elapsed,
+            statuses))
+
+
+def options():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8320)
+    parser.add_argument('--users', type=int, default=10000,
+        help="the number of synthetic users")
+    parser.add_argument('--timeline_size', type=int, default=200,
+        help="the number of tweets in each user's timeline")
+    parser.add_argument('--max_turns', type=int, default=8,
+        help="the maximum length of a conversation")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--api_latency', type=parse_latency,
+        default=parse_latency('const:0'),
+        help="latency of API requests, e.g. lognormal:-3,0.5")
+    parser.add_argument('--page_latency', type=parse_latency,
+        default=parse_latency('const:0'),
+        help="latency of permalink pages, e.g. uniform:0.05,0.3")
+    parser.add_argument('--error_rate', type=float, default=0.0,
+        help="fraction of requests that fail with a 503")
+    parser.add_argument('--retry_after', type=int, default=0,
+        help="Retry-After seconds sent with 503s (0 to omit the header)")
+    parser.add_argument('--throttle_rate', type=float, default=0.0,
+        help="fraction of API requests that get a spurious 429")
+    parser.add_argument('--window', type=int, default=900,
+        help="seconds of a rate limit window")
+    parser.add_argument('--limit', action='append', default=[],
+        metavar='ENDPOINT=N',
+        help="requests per window of an endpoint, "
+             "e.g. /statuses/lookup=300 (can be repeated)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    opts = options()
+
+    limits = dict(RATE_LIMITS)
+    for limit in opts.limit:
+        endpoint, _, n = limit.partition('=')
+        if endpoint not in limits:
+            raise SystemExit("unknown endpoint: " + endpoint)
+        limits[endpoint] = int(n)
+
+    world = World(opts.users, opts.timeline_size, opts.max_turns, opts.seed)
+    server = StandinServer((opts.host, opts.port), world,
+        RateLimits(limits, opts.window), opts.api_latency, opts.page_latency,
+        opts.error_rate, opts.throttle_rate, opts.retry_after)
+    logging.info("Serving on http://{}:{}".format(opts.host, opts.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -7,9 +7,23 @@
    This software is released under the MIT License.
    http://opensource.org/licenses/mit-license.php
 
+   Dialogs are streamed from the files, so printing starts right away
+   even for huge collections. Both the <name>.json files and the
+   <name>.jsonl files of collect_twitter_dialogs.py can be read.
+   With --build_index, an index of the byte offset of each dialog is saved
+   next to each file (<file>.offsets), and --id prints single dialogs
+   from it without scanning the file. The index records the size and the
+   modification time of its file, and --id rebuilds it when the file has
+   changed since.
+
 """
 
+import argparse
+import bisect
 import json
+import mmap
+import os
+import struct
 import sys
 import six
 
@@ -17,21 +31,236 @@ if six.PY2:
     reload(sys)
     sys.setdefaultencoding('utf-8')
 
-if len(sys.argv) < 2:
-    print ('usage: view_dialogs.py dialogs.json ...')
-    sys.exit(1)
-
-for fn in sys.argv[1:]:
-    dialog_set = json.load(open(fn,'r'))
-    for tid in sorted([int(s) for s in dialog_set.keys()]):
-        dialog = dialog_set[str(tid)]
-        lang = dialog[0]['lang']
-        if lang == 'en':
-            print ('--- ID:%d (length=%d) ---\n' % (tid, len(dialog)))
-            for utterance in dialog:
-                screen_name = utterance['user']['screen_name']
-                name = utterance['user']['name']
-                text = utterance['text']
-                print ('%s (%s)' % (utterance['created_at'],utterance['id']))
-                print ('%s (@%s) : %s\n' % (name, screen_name, text))
+CHUNK_SIZE = 1 << 20
+decoder = json.JSONDecoder()
+
+
+def skip(buf, pos, chars):
+    while pos < len(buf) and buf[pos] in chars:
+        pos += 1
+    return pos
+
+
+def iter_json(fn):
+    '''
+    yield (tid, dialog, offset, length) for each dialog of a <name>.json
+    file, reading it in chunks instead of loading the whole object
+    '''
+    with open(fn, 'rb') as f:
+        # latin-1 maps each byte to one character, so positions in buf
+        # are byte offsets in the file
+        buf = f.read(CHUNK_SIZE).decode('latin-1')
+        base = 0 # file offset of buf[0]
+        pos = skip(buf, 0, ' \t\r\n')
+        if buf[pos:pos+1] != '{':
+            raise ValueError('%s is not a dialog file' % fn)
+        pos += 1
+        eof = False
+        while True:
+            record_start = pos
+            try:
+                pos = skip(buf, pos, ' \t\r\n,')
+                if buf[pos:pos+1] == '}':
+                    return
+                tid, pos = decoder.raw_decode(buf, pos)
+                pos = skip(buf, pos, ' \t\r\n:')
+                start = pos
+                dialog, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                # the dialog continues in the next chunk
+                buf = buf[record_start:]
+                base += record_start
+                pos = 0
+                chunk = f.read(CHUNK_SIZE)
+                eof = len(chunk) == 0
+                buf += chunk.decode('latin-1')
+                continue
+            text = buf[start:pos]
+            if not is_ascii(text):
+                # decode the utf-8 bytes properly
+                dialog = json.loads(text.encode('latin-1').decode('utf-8'))
+            yield tid, dialog, base + start, pos - start
+
+
+def is_ascii(text):
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def iter_jsonl(fn):
+    '''
+    yield (tid, dialog, offset, length) for each live dialog of a
+    <name>.jsonl file
+    '''
+    superseded = set()
+    index_fn = fn[:-len('.jsonl')] + '.idx.json'
+    if os.path.exists(index_fn):
+        superseded = set(json.load(open(index_fn,'r'))['superseded'])
+    offset = 0
+    with open(fn, 'rb') as f:
+        for line in f:
+            record = json.loads(line.decode('utf-8'))
+            if record['id'] not in superseded:
+                yield record['id'], record['dialog'], offset, len(line)
+            offset += len(line)
+
+
+def iter_dialogs(fn):
+    if fn.endswith('.jsonl'):
+        return iter_jsonl(fn)
+    return iter_json(fn)
+
+
+def read_dialog(f, offset, length):
+    f.seek(offset)
+    record = json.loads(f.read(length).decode('utf-8'))
+    if isinstance(record, dict): # a line of a .jsonl file
+        record = record['dialog']
+    return record
+
+
+class OffsetIndex(object):
+    '''
+      Fixed-width records (tid, offset, length) sorted by tid, searched
+      in place with a binary search over a memory map. A header holds the
+      size and the modification time (ns) of the indexed file
+    '''
+    header = struct.Struct('<QQ')
+    record = struct.Struct('<QQI')
+
+    def __init__(self, fn):
+        self.source = fn
+        self.fn = fn + '.offsets'
+
+    def exists(self):
+        return os.path.exists(self.fn)
+
+    def source_stat(self):
+        stat = os.stat(self.source)
+        return stat.st_size, stat.st_mtime_ns
+
+    def is_current(self):
+        '''
+        False if the file changed after the index was built
+        '''
+        with open(self.fn, 'rb') as f:
+            header = f.read(self.header.size)
+        return len(header) == self.header.size and \
+            self.header.unpack(header) == self.source_stat()
+
+    def build(self):
+        '''
+        save the index of all the dialogs of the file
+        '''
+        stat = self.source_stat() # before reading, so changes made
+                                  # meanwhile make the index stale
+        records = sorted((int(tid), offset, length)
+                         for tid, _, offset, length in iter_dialogs(self.source))
+        tmp_fn = self.fn + '.tmp'
+        with open(tmp_fn, 'wb') as f:
+            f.write(self.header.pack(*stat))
+            for record in records:
+                f.write(self.record.pack(*record))
+        os.replace(tmp_fn, self.fn)
+        return len(records)
+
+    def lookup(self, tid):
+        with open(self.fn, 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= self.header.size:
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            start, size = self.header.size, self.record.size
+            n = (len(data) - start) // size
+            keys = KeyView(data, start, size, n)
+            i = bisect.bisect_left(keys, tid)
+            if i < n and keys[i] == tid:
+                _, offset, length = self.record.unpack_from(data,
+                                                            start + i * size)
+                return offset, length
+        return None
+
+
+class KeyView(object):
+    '''the tids of an OffsetIndex as a sequence, for bisect'''
+    def __init__(self, data, start, size, n):
+        self.data, self.start, self.size, self.n = data, start, size, n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return struct.unpack_from('<Q', self.data, self.start + i * self.size)[0]
+
+
+def matches(dialog, args):
+    if args.min_length and len(dialog) < args.min_length:
+        return False
+    if args.max_length and len(dialog) > args.max_length:
+        return False
+    if args.lang != 'any' and dialog[0]['lang'] != args.lang:
+        return False
+    if args.user and args.user not in \
+        [utterance['user']['screen_name'] for utterance in dialog]:
+        return False
+    return True
+
+
+def print_dialog(tid, dialog):
+    print ('--- ID:%d (length=%d) ---\n' % (int(tid), len(dialog)))
+    for utterance in dialog:
+        screen_name = utterance['user']['screen_name']
+        name = utterance['user']['name']
+        text = utterance['text']
+        print ('%s (%s)' % (utterance['created_at'],utterance['id']))
+        print ('%s (@%s) : %s\n' % (name, screen_name, text))
+
+
+def Main(args):
+    for fn in args.files:
+        index = OffsetIndex(fn)
+
+        if args.id:
+            if not index.exists():
+                sys.stderr.write('no index for %s, use --build_index\n' % fn)
+                continue
+            if not index.is_current():
+                n = index.build()
+                sys.stderr.write('%s changed, re-indexed %d dialogs\n' % (fn, n))
+            with open(fn, 'rb') as f:
+                for tid in args.id:
+                    found = index.lookup(tid)
+                    if found is not None:
+                        print_dialog(tid, read_dialog(f, *found))
+            continue
+
+        if args.build_index:
+            # before printing, so a closed output doesn't stop it
+            n = index.build()
+            sys.stderr.write('indexed %d dialogs in %s\n' % (n, index.fn))
+
+        for tid, dialog, offset, length in iter_dialogs(fn):
+            if matches(dialog, args):
+                print_dialog(tid, dialog)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--min_length', type=int, help="minimum number of turns")
+    parser.add_argument('--max_length', type=int, help="maximum number of turns")
+    parser.add_argument('--lang', default='en',
+                        help="language of the first turn ('any' for all)")
+    parser.add_argument('--user', help="only dialogs with this screen name")
+    parser.add_argument('--id', type=int, action='append',
+                        help="print the dialog ending in this tweet id (needs an index)")
+    parser.add_argument('--build_index', action='store_true',
+                        help="save the offset of each dialog next to each file")
+    parser.add_argument('files', metavar='FILE', nargs='+',
+                        help="dialogs.json or dialogs.jsonl files")
+    args = parser.parse_args()
 
+    Main(args)